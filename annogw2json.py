@@ -1,7 +1,14 @@
-import sys,os,re,itertools
+import sys,os,re,itertools,time,base64
 import xml.etree.ElementTree as ET
 import json
+import jsonio
 import parsetools
+import sentjson2xml
+import docindex
+import bgzf
+import convstats
+import docstats
+import jfields
 try:
     import core2json
 except ImportError:
@@ -9,16 +16,6 @@ except ImportError:
 
 # XML_PARSER = ET.XMLParser(encoding="utf-8")
 
-try:
-    import ujson
-    def mydumps(x, *args, **kwargs):
-        # README on https://github.com/esnme/ultrajson
-        kwargs['ensure_ascii'] = False
-        return ujson.dumps(x, *args, **kwargs)
-except ImportError:
-    def mydumps(x, *args, **kwargs):
-        return json.dumps(x, separators=(',',':'), *args, **kwargs)
-
 def smartopen(filename):
     if filename.endswith('.gz'):
         import gzip
@@ -26,9 +23,8 @@ def smartopen(filename):
     else:
         return open(filename)
 
-def yield_annogw_docstr(stream):
+def yield_annogw_docstr(stream, has_started=False):
     cur_doclines = []
-    has_started = False
     for line in stream:
         line = line.rstrip('\n')
         if not line: continue
@@ -42,11 +38,50 @@ def yield_annogw_docstr(stream):
     if cur_doclines and cur_doclines[0].startswith('<DOC '):
         yield '\n'.join(cur_doclines)
 
+class LRUCache(object):
+    """A dict of at most maxsize entries, forgetting the least recently used"""
+    def __init__(self, maxsize):
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            return default
+        self.data[key] = value
+        return value
+    def put(self, key, value):
+        if key in self.data:
+            del self.data[key]
+        elif len(self.data) >= self.maxsize:
+            self.data.popitem(last=False)
+        self.data[key] = value
+
+# create_text_object_from_parse() results by raw parse string, since
+# headlines and especially datelines repeat a lot.  None turns it off.
+text_object_cache = LRUCache(20000)
+
 def create_text_object_from_parse(parsestr):
-    parsestr = convert_to_unicode(parsestr).encode('utf8')
-    parsestr = re.sub(r'\s+', ' ', parsestr)
-    parsestr = parsestr.strip()
-    parsestr = parsestr.decode('utf8')
+    """Tokens and normalized parse string for a HEADLINE or DATELINE.  The
+    result may be shared with other calls, so don't modify it."""
+    if text_object_cache is None:
+        return text_object_from_parse(parsestr)
+    obj = text_object_cache.get(parsestr)
+    if obj is not None:
+        convstats.count('headline_cache_hits')
+        return obj
+    convstats.count('headline_cache_misses')
+    obj = text_object_from_parse(parsestr)
+    text_object_cache.put(parsestr, obj)
+    return obj
+
+# without re.UNICODE, \s is only ASCII whitespace, as it was when this ran on
+# the utf8 bytes.  after the sub, the only ASCII whitespace left is ' '.
+_whitespace_re = re.compile(r'\s+')
+
+def text_object_from_parse(parsestr):
+    parsestr = _whitespace_re.sub(u' ', convert_to_unicode(parsestr)).strip(u' ')
     if not parsestr:
         return {'tokens':[], 'parse':parsestr}
     try:
@@ -82,49 +117,650 @@ def process_sentences_justsent(sentences_x):
 def process_sentences_full(sentences_x):
     return core2json.convert_corexml_sentences_fromnode(sentences_x)
 
-def process_stream(stream, mode):
-    for docstr in yield_annogw_docstr(stream):
-        # docstr = docstr.decode('utf8','ignore').encode('utf8')
-        try:
-            doc_x = ET.fromstring(docstr)
-        except ET.ParseError:
-            print>>sys.stderr, "XML PARSE ERROR, str length %s, start:\t%s" % (len(docstr), repr(docstr[:100]))
-            continue
-        out_meta = {}
-        out_meta.update( dict(doc_x.items()) )
-        out_sentences = []
-        out_entities = None
-        for topchild in doc_x:
-            tag = topchild.tag
-            if tag=='HEADLINE' or tag=='DATELINE':
-                out_meta[tag.lower()] = create_text_object_from_parse(topchild.text)
-            elif tag=='TEXT':
-                pass
-            elif tag=='coreferences' or tag=='coreference':
-                # the file nyt_eng_199710.xml has <coreference> instead of
-                # <coreferences> in the topchidld.  didn't see this in any
-                # other file. argh!
-                if mode=='full':
-                    out_entities = core2json.convert_corexml_coref_fromnode(topchild, out_sentences)
-                else:
+def skip_annogw_docs(stream, ndocs):
+    """Consume the lines of the first ndocs documents, as
+    yield_annogw_docstr() would split them, without building them.  Continue
+    with yield_annogw_docstr(stream, has_started=True)."""
+    if ndocs <= 0: return
+    has_started = False
+    n = 0
+    for line in stream:
+        if not has_started:
+            if not line.startswith('<DOC '): continue
+            has_started = True
+        if line.strip() == '</DOC>':
+            n += 1
+            if n >= ndocs: return
+
+def docheader_from_docstr(docstr):
+    return docstr.split('\n', 1)[0]
+
+def parse_docstr(docstr):
+    # docstr = docstr.decode('utf8','ignore').encode('utf8')
+    try:
+        return ET.fromstring(docstr)
+    except ET.ParseError:
+        print>>sys.stderr, "XML PARSE ERROR, str length %s, start:\t%s" % (len(docstr), repr(docstr[:100]))
+        convstats.count('parse_errors')
+        return None
+
+class SkippingTreeBuilder(object):
+    """Parser target that builds a normal tree, except that elements whose
+    tag is in skip_tags (and everything under them) are dropped as they are
+    parsed, without ever being built."""
+    def __init__(self, skip_tags):
+        self.builder = ET.TreeBuilder()
+        self.skip_tags = skip_tags
+        self.skip_depth = 0
+    def start(self, tag, attrs):
+        if self.skip_depth or tag in self.skip_tags:
+            self.skip_depth += 1
+            return
+        return self.builder.start(tag, attrs)
+    def end(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        return self.builder.end(tag)
+    def data(self, data):
+        if not self.skip_depth:
+            self.builder.data(data)
+    def close(self):
+        return self.builder.close()
+
+SKIP_TAGS = frozenset(['TEXT'])
+
+def yield_annogw_docelems_streaming(stream, has_started=False, skip_tags=SKIP_TAGS):
+    """Yields (docheader, doc_x) pairs, where docheader is the raw
+    '<DOC ...>' line and doc_x is None if the document didn't parse.  Feeds
+    the raw input lines straight into an incremental parser, one parser per
+    <DOC>, instead of collecting and re-joining the document string first.
+    Subtrees in skip_tags are never built.  Document boundaries are found
+    exactly as in yield_annogw_docstr(), so the same documents come out."""
+    parser = None
+    first_line = None
+    nbytes = 0
+    failed = False
+    for line in stream:
+        if line == '\n' or not line: continue
+        if first_line is None:
+            if not has_started and not line.startswith('<DOC '):
+                continue
+            has_started = True
+            first_line = line
+            parser = ET.XMLParser(target=SkippingTreeBuilder(skip_tags))
+            nbytes = 0
+            failed = False
+        nbytes += len(line)
+        if not failed:
+            try:
+                parser.feed(line)
+            except ET.ParseError:
+                failed = True
+        if line.strip() == '</DOC>':
+            doc_x = None
+            if not failed:
+                try:
+                    doc_x = parser.close()
+                except ET.ParseError:
                     pass
-            elif tag=='sentences':
-                f = eval('process_sentences_' + mode)
-                for sentinfo in f(topchild):
-                    out_sentences.append(sentinfo)
+            if doc_x is None:
+                print>>sys.stderr, "XML PARSE ERROR, str length %s, start:\t%s" % (nbytes, repr(first_line[:100]))
+                convstats.count('parse_errors')
+            yield first_line.rstrip('\n'), doc_x
+            first_line = None
+    if first_line is not None and first_line.startswith('<DOC '):
+        # truncated final document; can't be well-formed
+        print>>sys.stderr, "XML PARSE ERROR, str length %s, start:\t%s" % (nbytes, repr(first_line[:100]))
+        yield first_line.rstrip('\n'), None
+
+def convert_doc_element(doc_x, mode):
+    """Convert one parsed <DOC> node.  Returns (docid, meta, payload)."""
+    out_meta = {}
+    out_meta.update( dict(doc_x.items()) )
+    out_sentences = []
+    out_entities = None
+    for topchild in doc_x:
+        tag = topchild.tag
+        if tag=='HEADLINE' or tag=='DATELINE':
+            convstats.stage_start('headline')
+            out_meta[tag.lower()] = create_text_object_from_parse(topchild.text)
+            convstats.stage_end()
+        elif tag=='TEXT':
+            pass
+        elif tag=='coreferences' or tag=='coreference':
+            # the file nyt_eng_199710.xml has <coreference> instead of
+            # <coreferences> in the topchidld.  didn't see this in any
+            # other file. argh!
+            if mode=='full':
+                convstats.stage_start('coref')
+                out_entities = core2json.convert_corexml_coref_fromnode(topchild, out_sentences)
+                convstats.stage_end()
+            else:
+                pass
+        elif tag=='sentences':
+            convstats.stage_start('sentences')
+            f = eval('process_sentences_' + mode)
+            for sentinfo in f(topchild):
+                out_sentences.append(sentinfo)
+            convstats.stage_end()
+        else:
+            assert False, "dunno what to do with XML node type " + tag
+
+    payload = out_sentences if mode=='justsent' else {'sentences':out_sentences, 'entities':out_entities} if mode=='full' else None
+    assert payload is not None
+    convstats.count('sentences', len(out_sentences))
+    return out_meta['id'], out_meta, payload
+
+## Output formats.  Everything is rendered from one conversion of each
+## document, so any combination can be written in a single pass:
+##   jdoc      what 'full' mode prints
+##   justsent  what 'justsent' mode prints
+##   meta      the first two columns of jdoc (what 'cut -f1-2' gave)
+##   docid     the raw '<DOC ...>' header line (what 'zgrep ^<DOC' gave)
+##   sentxml   sentjson2xml.py's output
+##   jfields   jdoc with each field in its own column (see jfields.py)
+
+EMIT_FORMATS = ['jdoc','justsent','meta','docid','sentxml','jfields']
+MODE_FORMATS = {'full':'jdoc', 'justsent':'justsent'}
+
+# a labelcodes.LabelCoder, for --label-codes: jdoc's POS/NER/dep labels as
+# integer codes, with the vocab on a header line.  (Set before starting any
+# worker processes, which inherit it.)
+label_coder = None
+
+# a doccache.DocCache, for --cache.  Bump CONVERTER_VERSION whenever the
+# converted output changes, so old cache entries stop matching.
+doc_cache = None
+CONVERTER_VERSION = 1
+
+# for --doc-stats: also render each document's docstats record (under the
+# key 'docstats'), which EmitWriter adds up instead of writing out
+collect_doc_stats = False
+
+def cache_options():
+    # the JSON backends' outputs differ in their bytes, so they don't share entries
+    return "annogw2json v%d label_codes=%s json=%s" % (CONVERTER_VERSION, label_coder is not None, jsonio.backend)
+
+def justsent_from_full(sentences):
+    # same token cleanup as process_sentences_justsent()
+    return [{'tokens': [convert_to_unicode(w).strip() for w in s['tokens']]}
+            for s in sentences]
+
+def render_document(docheader, doc_x, emit):
+    """Returns {format: text} for one document, for the formats in 'emit'.
+    A document that didn't parse only gets a 'docid' line."""
+    out = {}
+    if 'docid' in emit:
+        out['docid'] = docheader
+    if doc_x is None:
+        if collect_doc_stats:
+            out['docstats'] = docstats.doc_record(docheader)
+        return out
+    if not collect_doc_stats and not any(f != 'docid' for f in emit):
+        return out
+    mode = 'full' if 'jdoc' in emit or 'jfields' in emit else 'justsent'
+    docid, out_meta, payload = convert_doc_element(doc_x, mode)
+    if collect_doc_stats:
+        if mode=='full':
+            out['docstats'] = docstats.doc_record(docheader, out_meta, payload['sentences'], payload['entities'])
+        else:
+            out['docstats'] = docstats.doc_record(docheader, out_meta, payload)
+    convstats.stage_start('serialize')
+    metastr = jsonio.dumps(out_meta)
+    if 'jdoc' in emit:
+        jdoc_payload = payload
+        if label_coder is not None:
+            jdoc_payload = dict(payload, sentences=label_coder.encode_sentences(payload['sentences']))
+        out['jdoc'] = "%s\t%s\t%s" % (docid, metastr, jsonio.dumps(jdoc_payload))
+    if 'jfields' in emit:
+        out['jfields'] = jfields.render_fields(docid, metastr, payload)
+    if 'meta' in emit:
+        out['meta'] = "%s\t%s" % (docid, metastr)
+    if 'justsent' in emit or 'sentxml' in emit:
+        token_sents = payload if mode=='justsent' else justsent_from_full(payload['sentences'])
+        if 'justsent' in emit:
+            out['justsent'] = "%s\t%s\t%s" % (docid, metastr, jsonio.dumps(token_sents))
+        if 'sentxml' in emit:
+            out['sentxml'] = sentjson2xml.document_xml(docid, out_meta, token_sents)
+    convstats.stage_end()
+    return out
+
+INDEXABLE_FORMATS = ['jdoc','justsent','meta','jfields']
+
+class EmitWriter(object):
+    """Writes rendered documents to one output stream per format.
+    'indexes' optionally maps formats to docindex.IndexWriters.  Every input
+    document goes through write(), in order, even if it renders to nothing,
+    so ndocs is the number of input documents done.  With doc_stats (a
+    docstats.DocStats), rendered 'docstats' records are added to it, and it's
+    saved on close."""
+    def __init__(self, outputs, indexes=None, checkpointer=None, resumed=False, doc_stats=None):
+        self.outputs = outputs
+        self.indexes = indexes or {}
+        self.checkpointer = checkpointer
+        self.doc_stats = doc_stats
+        self.ndocs = 0
+        if 'sentxml' in outputs and not resumed:
+            outputs['sentxml'].write(sentjson2xml.HEADER + '\n')
+        if 'jdoc' in outputs and label_coder is not None and not resumed:
+            header = label_coder.header_line()
+            outputs['jdoc'].write(header)
+            if 'jdoc' in self.indexes and self.indexes['jdoc'].tell is None:
+                self.indexes['jdoc'].skip(len(header))
+    def write(self, rendered):
+        convstats.stage_start('write')
+        record = rendered.pop('docstats', None)
+        if record is not None and self.doc_stats is not None:
+            self.doc_stats.add_record(record)
+        for fmt,text in rendered.iteritems():
+            text += '\n'
+            if fmt in self.indexes:
+                self.indexes[fmt].add(text.split('\t', 1)[0], len(text))
+            self.outputs[fmt].write(text)
+            convstats.count('bytes_out', len(text))
+        self.ndocs += 1
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_checkpoint(self)
+        convstats.stage_end()
+        if convstats.active is not None:
+            convstats.active.count('docs')
+            convstats.active.maybe_report()
+    def flush(self):
+        for f in self.outputs.values():
+            f.flush()
+        for w in self.indexes.values():
+            w.f.flush()
+    def close(self):
+        if 'sentxml' in self.outputs:
+            self.outputs['sentxml'].write(sentjson2xml.FOOTER + '\n')
+        for f in self.outputs.values():
+            if isinstance(f, bgzf.BlockGzipWriter):
+                f.finish()
+        self.flush()
+        if self.doc_stats is not None and self.doc_stats.path:
+            self.doc_stats.save()
+        if self.checkpointer is not None:
+            self.checkpointer.checkpoint(self, finished=True)
+        for w in self.indexes.values():
+            w.close()
+    def abandon(self):
+        """After a failure: closes the files without finishing them (no
+        footer, no final checkpoint), so the last checkpoint still applies"""
+        for f in self.outputs.values():
+            raw_file(f).close()
+        for w in self.indexes.values():
+            w.f.close()
+
+## Checkpoints, for restarting a killed job where it left off.  PREFIX.checkpoint
+## records how many input documents are completely written, and the length of
+## every output and index file at that point.  --resume truncates the files
+## back to those lengths and skips that many documents of input.  Block-gzip
+## outputs aren't made to end a block at a checkpoint (that would make the
+## block boundaries, and so the file, depend on timing); instead the
+## checkpoint holds the current block's data, and resuming carries on with it.
+
+def checkpoint_path(prefix):
+    return prefix + '.checkpoint'
+
+def raw_file(f):
+    # the file under a bgzf.BlockGzipWriter
+    return getattr(f, 'f', f)
+
+class Checkpointer(object):
+    def __init__(self, prefix, every_secs=120, start_docs=0):
+        self.path = checkpoint_path(prefix)
+        self.every_secs = every_secs
+        self.start_docs = start_docs
+        self.last_time = time.time()
+
+    def maybe_checkpoint(self, writer):
+        if time.time() - self.last_time >= self.every_secs:
+            self.checkpoint(writer)
+
+    def checkpoint(self, writer, finished=False):
+        state = {'docs': self.start_docs + writer.ndocs, 'finished': finished,
+                 'outputs': {}, 'indexes': {}, 'pending': {},
+                 'bgzf': any(isinstance(f, bgzf.BlockGzipWriter) for f in writer.outputs.values())}
+        for fmt,f in writer.outputs.items():
+            if isinstance(f, bgzf.BlockGzipWriter):
+                pending = f.sync()
+                if pending:
+                    state['pending'][fmt] = base64.b64encode(pending)
             else:
-                assert False, "dunno what to do with XML node type " + tag
+                f.flush()
+        for w in writer.indexes.values():
+            w.f.flush()
+        for fmt,f in writer.outputs.items():
+            os.fsync(raw_file(f).fileno())
+            state['outputs'][fmt] = raw_file(f).tell()
+        for fmt,w in writer.indexes.items():
+            os.fsync(w.f.fileno())
+            state['indexes'][fmt] = w.f.tell()
+        if writer.doc_stats is not None:
+            state['doc_stats'] = writer.doc_stats.to_json()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+        self.last_time = time.time()
+
+def load_checkpoint(prefix):
+    path = checkpoint_path(prefix)
+    if not os.path.exists(path):
+        return None
+    try:
+        return json.load(open(path))
+    except ValueError:
+        # e.g. left empty by a crash: start over
+        print>>sys.stderr, "%s: unreadable checkpoint, ignoring it" % path
+        return None
+
+def checkpoint_matches(state, emit, index=False, compress=False):
+    """Whether a checkpoint was made for these outputs"""
+    want_indexes = sorted(f for f in emit if f in INDEXABLE_FORMATS) if index else []
+    # (older checkpoints don't record 'bgzf')
+    return (sorted(state['outputs']) == sorted(emit) and
+            sorted(state['indexes']) == want_indexes and
+            state.get('bgzf', compress) == compress)
+
+def reopen_truncated(path, length):
+    f = open(path, 'r+b', jsonio.OUTPUT_BUFSIZE)
+    f.truncate(length)
+    f.seek(length)
+    return f
+
+def resume_emit_outputs(prefix, state, compress=False):
+    """Reopen the outputs and indexes recorded in a checkpoint, truncated to
+    their checkpointed lengths.  Returns (outputs, indexes)."""
+    outputs, indexes = {}, {}
+    for fmt,length in state['outputs'].items():
+        f = reopen_truncated(output_path(prefix, fmt, compress), length)
+        if compress:
+            f = bgzf.BlockGzipWriter(f)
+            f.resume_at(length, base64.b64decode(state.get('pending', {}).get(fmt, '')))
+        outputs[fmt] = f
+    for fmt,length in state['indexes'].items():
+        f = reopen_truncated(docindex.index_path(output_path(prefix, fmt, compress)), length)
+        out = outputs[fmt]
+        indexes[fmt] = docindex.IndexWriter(f, offset=state['outputs'][fmt],
+                tell=out.tell_virtual if compress else None)
+    return outputs, indexes
+
+def output_path(prefix, fmt, compress=False):
+    return "%s.%s%s" % (prefix, fmt, '.gz' if compress else '')
+
+def open_emit_outputs(prefix, emit, compress=False):
+    """With compress, outputs are block-gzip (see bgzf.py) PREFIX.F.gz files"""
+    outputs = {}
+    for fmt in emit:
+        f = open(output_path(prefix, fmt, compress), 'wb', jsonio.OUTPUT_BUFSIZE)
+        outputs[fmt] = bgzf.BlockGzipWriter(f) if compress else f
+    return outputs
+
+def open_emit_indexes(prefix, outputs, compress=False):
+    return dict((fmt, docindex.open_index_writer(output_path(prefix, fmt, compress),
+                        tell=out.tell_virtual if compress else None))
+                for fmt,out in outputs.items() if fmt in INDEXABLE_FORMATS)
+
+def doc_stats_path(prefix):
+    return prefix + '.docstats'
+
+def open_emit_writer(prefix, emit, index=False, compress=False, checkpoint=False,
+                     resume=False, checkpoint_secs=120, doc_stats_file=None):
+    """An EmitWriter for the PREFIX.F files, and how many input documents to
+    skip.  With resume, continues from PREFIX.checkpoint if there is one,
+    and returns (None, ndocs) if it says the job already finished.  With
+    doc_stats_file, document statistics are gathered and saved there."""
+    state = load_checkpoint(prefix) if resume else None
+    skip_docs = 0
+    doc_stats = docstats.DocStats(source=prefix, path=doc_stats_file) if doc_stats_file else None
+    if state is not None and not checkpoint_matches(state, emit, index, compress):
+        if not state['finished']:
+            raise ValueError("checkpoint was for other outputs: --emit %s%s%s" % (','.join(sorted(state['outputs'])),
+                    ' --index' if state['indexes'] else '', ' --bgzf' if state.get('bgzf') else ''))
+        # a finished conversion to other outputs: start this one afresh
+        state = None
+    if state is not None:
+        if state['finished']:
+            if doc_stats is not None and 'doc_stats' in state and not os.path.exists(doc_stats_file):
+                # killed between saving the stats and the final checkpoint
+                docstats.DocStats.from_json(state['doc_stats']).save(doc_stats_file)
+            return None, state['docs']
+        if doc_stats is not None:
+            if 'doc_stats' not in state:
+                raise ValueError("checkpoint has no document stats, so --doc-stats can't resume it")
+            doc_stats = docstats.DocStats.from_json(state['doc_stats'], doc_stats_file)
+        outputs, indexes = resume_emit_outputs(prefix, state, compress)
+        skip_docs = state['docs']
+    else:
+        outputs = open_emit_outputs(prefix, emit, compress)
+        indexes = open_emit_indexes(prefix, outputs, compress) if index else None
+    checkpointer = None
+    if checkpoint or resume:
+        checkpointer = Checkpointer(prefix, checkpoint_secs, skip_docs)
+    return EmitWriter(outputs, indexes, checkpointer, resumed=state is not None,
+                      doc_stats=doc_stats), skip_docs
+
+def process_stream(stream, mode=None, streaming=False, emit=None, writer=None, skip_docs=0):
+    """Convert the AGW XML on 'stream'.  By default writes the 'mode' format
+    to stdout; otherwise renders the formats in 'emit' to an EmitWriter.
+    skip_docs input documents are skipped first (for resuming)."""
+    emit = emit or [MODE_FORMATS[mode]]
+    writer = writer or EmitWriter({emit[0]: sys.stdout})
+    if convstats.active is not None:
+        stream = convstats.TimedLines(stream, convstats.active)
+    skip_annogw_docs(stream, skip_docs)
+    if streaming:
+        docs = yield_annogw_docelems_streaming(stream, has_started=skip_docs > 0)
+        # splitting and parsing are interleaved here; both count as 'parse'
+        split_stage = 'parse'
+    else:
+        docs = ((docheader_from_docstr(d), d) for d in yield_annogw_docstr(stream, has_started=skip_docs > 0))
+        split_stage = 'split'
+    while True:
+        convstats.stage_start(split_stage)
+        docheader, doc_x = next(docs, (None, None))
+        convstats.stage_end()
+        if docheader is None: break
+        if streaming:
+            writer.write(render_document(docheader, doc_x, emit))
+        else:
+            writer.write(convert_docstr(docheader, doc_x, emit))
+    writer.close()
+
+def convert_docstr(docheader, docstr, emit):
+    """Parse and render one document string, or take it from the cache"""
+    if emit == ['docid'] and not collect_doc_stats:
+        # the header is all that's needed; don't parse
+        return {'docid': docheader}
+    if doc_cache is not None:
+        rendered = doc_cache.get(docstr, emit + ['docstats'] if collect_doc_stats else emit)
+        convstats.count('cache_hits' if rendered is not None else 'cache_misses')
+        if rendered is not None:
+            return rendered
+    convstats.stage_start('parse')
+    doc_x = parse_docstr(docstr)
+    convstats.stage_end()
+    rendered = render_document(docheader, doc_x, emit)
+    if doc_cache is not None and doc_x is not None:
+        doc_cache.put(docstr, rendered)
+    return rendered
+
+## Multiprocess version.  The main process only splits the input into
+## document strings; parsing, conversion and serialization happen in the
+## workers.
 
-        payload = out_sentences if mode=='justsent' else {'sentences':out_sentences, 'entities':out_entities} if mode=='full' else None
-        assert payload is not None
-        print "%s\t%s\t%s" % (out_meta['id'], mydumps(out_meta), mydumps(payload))
+def convert_docstr_chunk(docstrs, emit, with_stats=False):
+    """Worker function: document strings -> rendered outputs.  with_stats,
+    returns (rendered outputs, convstats summary for this chunk)."""
+    if with_stats:
+        convstats.active = convstats.Stats()
+    rendered = []
+    for docstr in docstrs:
+        rendered.append(convert_docstr(docheader_from_docstr(docstr), docstr, emit))
+    if with_stats:
+        return rendered, convstats.active.summary()
+    return rendered
+
+def process_stream_parallel(stream, workers, mode=None, emit=None, writer=None,
+                            skip_docs=0, chunksize=20, window=None):
+    """Like process_stream(), with conversion farmed out to a process pool.
+    Output stays in input order.  At most 'window' chunks are in flight at
+    once (default 4 per worker), which bounds memory when the reader is
+    faster than the workers."""
+    import multiprocessing
+    from collections import deque
+    emit = emit or [MODE_FORMATS[mode]]
+    writer = writer or EmitWriter({emit[0]: sys.stdout})
+    window = window or 4*workers
+    pool = multiprocessing.Pool(workers)
+    pending = deque()
+    def flush_oldest():
+        result = pending.popleft().get()
+        if convstats.active is not None:
+            result, worker_stats = result
+            convstats.active.merge(worker_stats)
+        for rendered in result:
+            writer.write(rendered)
+    try:
+        if convstats.active is not None:
+            stream = convstats.TimedLines(stream, convstats.active)
+        skip_annogw_docs(stream, skip_docs)
+        docstrs = yield_annogw_docstr(stream, has_started=skip_docs > 0)
+        while True:
+            convstats.stage_start('split')
+            chunk = list(itertools.islice(docstrs, chunksize))
+            convstats.stage_end()
+            if not chunk: break
+            if len(pending) >= window:
+                flush_oldest()
+            pending.append(pool.apply_async(convert_docstr_chunk, (chunk, emit, convstats.active is not None)))
+        while pending:
+            flush_oldest()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    writer.close()
 
 procname = None
 def main():
     import argparse; p = argparse.ArgumentParser()
-    p.add_argument('mode', choices=['full','justsent'])
+    p.add_argument('mode', nargs='?', choices=['full','justsent'])
+    p.add_argument('--emit', type=lambda s: s.split(','),
+            help="comma-separated output formats, from: " + ','.join(EMIT_FORMATS))
+    p.add_argument('--output-prefix',
+            help="with --emit, write format F to PREFIX.F (default: stdout, if only one format)")
+    p.add_argument('--index', action='store_true',
+            help="with --output-prefix, also write a docid index PREFIX.F.idx for " + ','.join(INDEXABLE_FORMATS))
+    p.add_argument('--bgzf', action='store_true',
+            help="with --output-prefix, write seekable block-gzip PREFIX.F.gz files")
+    p.add_argument('--checkpoint', action='store_true',
+            help="with --output-prefix, regularly record progress in PREFIX.checkpoint")
+    p.add_argument('--checkpoint-secs', type=float, default=120,
+            help="seconds between checkpoints (default %(default)s)")
+    p.add_argument('--resume', action='store_true',
+            help="continue from PREFIX.checkpoint if there is one (implies --checkpoint)")
+    p.add_argument('--stats', action='store_true',
+            help="report throughput and per-stage timings on stderr")
+    p.add_argument('--stats-file',
+            help="with --stats, append the JSON summary to this file (default: stderr)")
+    p.add_argument('--label-codes', action='store_true',
+            help="write jdoc's POS/NER/dep labels as integer codes, with a header line (see labelcodes.py)")
+    p.add_argument('--doc-stats', nargs='?', const='', metavar='FILE',
+            help="gather document type/sentence/token/entity counts into FILE (default PREFIX.docstats; see docstats.py)")
+    p.add_argument('--cache', metavar='DIR',
+            help="reuse converted documents from this cache directory (see doccache.py)")
+    p.add_argument('--cache-max-mb', type=float,
+            help="with --cache, afterwards evict least recently used entries down to this size")
+    p.add_argument('--headline-cache', type=int, default=20000,
+            help="remember this many parsed headlines/datelines (0: off)")
+    p.add_argument('--json-backend',
+            help="JSON encoder: " + ', '.join(sorted(jsonio.BACKENDS)) + " (default: ujson if installed, else json; see jsonio.py)")
+    p.add_argument('--streaming', action='store_true',
+            help="incremental per-document parsing; skips <TEXT> as it goes")
+    p.add_argument('--workers', type=int, default=1,
+            help="number of conversion processes (--streaming is single-process only)")
+    p.add_argument('--chunksize', type=int, default=20,
+            help="documents per work unit sent to a worker")
     args = p.parse_args()
-    process_stream(sys.stdin, mode=args.mode)
+    prefix = args.output_prefix
+    if (args.index or args.bgzf or args.checkpoint or args.resume) and not prefix:
+        p.error("--index, --bgzf, --checkpoint and --resume need --output-prefix")
+    if args.emit:
+        bad = [f for f in args.emit if f not in EMIT_FORMATS]
+        if bad: p.error("unknown --emit format(s): " + ','.join(bad))
+    elif args.mode:
+        args.emit = [MODE_FORMATS[args.mode]]
+    else:
+        p.error("need a mode or --emit")
+    if len(args.emit) > 1 and not prefix:
+        p.error("--output-prefix is needed to --emit more than one format")
+
+    if args.doc_stats == '' and not prefix:
+        p.error("--doc-stats needs a FILE or --output-prefix")
+    if args.doc_stats is not None:
+        global collect_doc_stats
+        collect_doc_stats = True
+        args.doc_stats = args.doc_stats or doc_stats_path(prefix)
+
+    if args.json_backend:
+        try:
+            jsonio.set_backend(args.json_backend)
+        except (ValueError, ImportError) as e:
+            p.error("--json-backend: %s" % e)
+    elif jsonio.env_error:
+        p.error(jsonio.env_error)
+
+    global text_object_cache
+    text_object_cache = LRUCache(args.headline_cache) if args.headline_cache > 0 else None
+
+    if args.cache and args.streaming:
+        p.error("--cache doesn't work with --streaming")
+    if args.workers > 1 and args.streaming:
+        p.error("--streaming doesn't work with --workers")
+    if args.label_codes:
+        import labelcodes
+        global label_coder
+        label_coder = labelcodes.LabelCoder()
+    if args.cache:
+        import doccache
+        global doc_cache
+        doc_cache = doccache.DocCache(args.cache, cache_options())
+
+    skip_docs = 0
+    if prefix:
+        try:
+            writer, skip_docs = open_emit_writer(prefix, args.emit, args.index, args.bgzf,
+                    args.checkpoint, args.resume, args.checkpoint_secs, args.doc_stats)
+        except ValueError as e:
+            p.error(str(e))
+        if writer is None:
+            print>>sys.stderr, "%s: already finished" % checkpoint_path(prefix)
+            return
+        if skip_docs:
+            print>>sys.stderr, "Resuming after %d documents" % skip_docs
+    else:
+        doc_stats = docstats.DocStats(path=args.doc_stats) if args.doc_stats else None
+        writer = EmitWriter({args.emit[0]: sys.stdout}, doc_stats=doc_stats)
+    if args.stats:
+        convstats.active = convstats.Stats(label=prefix)
+
+    if args.workers > 1:
+        process_stream_parallel(sys.stdin, workers=args.workers, emit=args.emit,
+                writer=writer, skip_docs=skip_docs, chunksize=args.chunksize)
+    else:
+        process_stream(sys.stdin, streaming=args.streaming, emit=args.emit,
+                writer=writer, skip_docs=skip_docs)
+    if convstats.active is not None:
+        convstats.active.write_summary(open(args.stats_file, 'a') if args.stats_file else None)
+    if args.cache and args.cache_max_mb:
+        doccache.evict(args.cache, args.cache_max_mb * 1e6)
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark for core2json.convert_corexml_coref_fromnode, against the
+old version that built dict entities and sorted them by dict comparison.
+Also checks the two give byte-identical JSON.
+
+By default it runs on coref-heavy synthetic documents (see synth_agw.py);
+or give it a real AGW file.
+
+  python2.7 benchmarks/bench_coref.py [--docs 200] [--chains 300]
+  python2.7 benchmarks/bench_coref.py --file gw/data/nyt_eng_199407.xml.gz
+"""
+import sys,os,time,json,random
+import xml.etree.ElementTree as ET
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+import annogw2json, core2json, synth_agw
+
+class OldEntity(dict):
+    def __hash__(self):
+        return hash('entity::' + self['id'])
+
+def convert_coref_dicts(coreference_node, sentences):
+    """convert_corexml_coref_fromnode before the rewrite: entities are dicts,
+    ordered by entities.sort() comparing them as dicts.  Its JSON is the
+    reference the new version must match byte for byte."""
+    if coreference_node is None:
+        return None
+
+    entities = []
+    for entity_x in coreference_node.findall('coreference'):
+        mentions = []
+        for mention_x in entity_x.findall('mention'):
+            m = {}
+            m['sentence'] = int(mention_x.find('sentence').text) - 1
+            m['start'] = int(mention_x.find('start').text) - 1
+            m['end'] = int(mention_x.find('end').text) - 1
+            m['head'] = int(mention_x.find('head').text) - 1
+            mentions.append(m)
+        ent = OldEntity()
+        ent['mentions'] = mentions
+        first_mention = min((m['sentence'],m['head']) for m in mentions)
+        ent['first_mention'] = first_mention
+        entities.append(ent)
+    entities.sort()
+    for i in range(len(entities)):
+        ent = entities[i]
+        ent['num'] = i
+        s,pos = ent['first_mention']
+        ent['id'] = "E%s" % i
+
+    return entities
+
+def synthetic_coref_nodes(ndocs, nchains, seed=0):
+    rng = random.Random(seed)
+    nodes = []
+    for d in range(ndocs):
+        sents = synth_agw.make_doc_sents(rng, 40, 25)
+        out = []
+        synth_agw.coref_xml(out, rng, sents, 'coreferences', nchains)
+        if out:
+            nodes.append(ET.fromstring('\n'.join(out)))
+    return nodes
+
+def file_coref_nodes(filename, maxdocs):
+    nodes = []
+    for docstr in annogw2json.yield_annogw_docstr(annogw2json.smartopen(filename)):
+        doc_x = annogw2json.parse_docstr(docstr)
+        if doc_x is None: continue
+        for tag in ['coreferences', 'coreference']:
+            x = doc_x.find(tag)
+            if x is not None: nodes.append(x)
+        if len(nodes) >= maxdocs: break
+    return nodes
+
+def timeit(f, nodes, reps=3):
+    best = None
+    for r in range(reps):
+        t0 = time.time()
+        for x in nodes:
+            f(x, None)
+        el = time.time() - t0
+        best = el if best is None else min(best, el)
+    return best
+
+def main():
+    import argparse; p = argparse.ArgumentParser()
+    p.add_argument('--file', help="real AGW .xml.gz instead of synthetic data")
+    p.add_argument('--docs', type=int, default=200)
+    p.add_argument('--chains', type=int, default=300, help="coref chains per synthetic doc")
+    args = p.parse_args()
+    if args.file:
+        nodes = file_coref_nodes(args.file, args.docs)
+    else:
+        nodes = synthetic_coref_nodes(args.docs, args.chains)
+
+    for x in nodes:
+        old = json.dumps(convert_coref_dicts(x, None))
+        new = json.dumps(core2json.convert_corexml_coref_fromnode(x, None))
+        assert old == new
+    nchains = sum(len(x) for x in nodes)
+    t_old = timeit(convert_coref_dicts, nodes)
+    t_new = timeit(core2json.convert_corexml_coref_fromnode, nodes)
+    print "%d docs, %d chains, outputs identical" % (len(nodes), nchains)
+    print "  dict entities: %.3fs   slots: %.3fs (%.2fx)" % (t_old, t_new, t_old/t_new)
+
+if __name__=='__main__':
+    main()
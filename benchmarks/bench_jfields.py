@@ -0,0 +1,53 @@
+"""
+Benchmark a tokens-only pass over jdoc (decoding every DeepInfo) against
+the same pass over jfields with the lazy reader (decoding only the tokens
+column).  Converts the jdoc to jfields in memory first, and checks both
+passes see the same tokens.
+
+  python2.7 benchmarks/bench_jfields.py gw/data/nyt_eng_199407.jdoc
+"""
+import sys,os,time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import jfields
+import jsonio
+
+def tokens_from_jdoc(lines):
+    n = 0
+    for line in lines:
+        full = jsonio.loads(line.split('\t')[2])
+        for s in full['sentences']:
+            n += len(s['tokens'])
+    return n
+
+def tokens_from_jfields(lines):
+    n = 0
+    for doc in jfields.read_docs(lines):
+        for toks in doc.tokens:
+            n += len(toks)
+    return n
+
+def timeit(f, lines, reps=3):
+    best = None
+    for r in range(reps):
+        t0 = time.time()
+        n = f(lines)
+        el = time.time() - t0
+        best = el if best is None else min(best, el)
+    return best, n
+
+def main():
+    jdoc_lines = [L for L in open(sys.argv[1]) if not L.startswith('#')]
+    jf_lines = []
+    for doc in jfields.read_docs(jdoc_lines):
+        payload = {'sentences': doc.sentences, 'entities': doc.entities}
+        jf_lines.append(jfields.render_fields(doc.docid, doc.cols[0], payload) + '\n')
+    for a,b in zip(jfields.read_docs(jdoc_lines), jfields.read_docs(jf_lines)):
+        assert a.tokens == b.tokens
+    t_jdoc, n1 = timeit(tokens_from_jdoc, jdoc_lines)
+    t_jf, n2 = timeit(tokens_from_jfields, jf_lines)
+    assert n1 == n2
+    print "%d docs, %d tokens" % (len(jdoc_lines), n1)
+    print "  jdoc full decode: %.3fs   jfields lazy tokens: %.3fs (%.2fx)" % (t_jdoc, t_jf, t_jdoc/t_jf)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Benchmark core2json's file reader with and without --read-threads, with a
+simulated per-file open latency (as on network storage).  Runs only the
+reading, not the conversion, and checks both see the same documents.
+
+  ls corenlp_out/*.xml.gz > files.txt
+  python2.7 benchmarks/bench_prefetch.py files.txt [latency_ms] [threads]
+"""
+import sys,os,time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import core2json
+
+def with_latency(secs):
+    real_open = core2json.smartopen
+    def slow_open(filename):
+        time.sleep(secs)
+        return real_open(filename)
+    core2json.smartopen = slow_open
+
+def read_all(filenames, threads):
+    t0 = time.time()
+    docs = [(docid, len(data)) for docid,data in
+            core2json.corexmls_from_files(iter(filenames), read_threads=threads)]
+    return time.time() - t0, docs
+
+def main():
+    filenames = [L.rstrip('\n') for L in open(sys.argv[1]) if L.strip()]
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.005
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    with_latency(latency)
+    t1, docs1 = read_all(filenames, 1)
+    tn, docsn = read_all(filenames, threads)
+    assert docs1 == docsn
+    print >>sys.stderr
+    print "%d files, %.0fms latency each" % (len(filenames), latency*1000)
+    print "  serial: %.3fs   %d threads: %.3fs (%.1fx)" % (t1, threads, tn, t1/tn)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for core2json.convert_corexml_sentences_fromnode, against
+the old XPath-per-field version, on the <sentences> of real AGW documents.
+Also checks the two give identical output.
+
+  python2.7 benchmarks/bench_sentences.py gw/data/nyt_eng_199407.xml.gz [maxdocs]
+"""
+import sys,os,re,time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import annogw2json, core2json
+
+def convert_sentences_xpath(sents_x, deptype='collapsed-ccprocessed-dependencies'):
+    """convert_corexml_sentences_fromnode before the single-pass rewrite: a
+    separate findall/findtext XPath query per field, per token."""
+    sents = []
+    for sent_x in sents_x:
+        sent_infos = {}
+        toks_x = sent_x.findall(".//token")
+        sent_infos['tokens'] = [t.findtext(".//word") for t in toks_x]
+        sent_infos['lemmas'] = [t.findtext(".//lemma") for t in toks_x]
+        sent_infos['pos'] = [t.findtext(".//POS") for t in toks_x]
+        sent_infos['ner'] = [t.findtext(".//NER") for t in toks_x]
+        char_offsets = []
+        for t in toks_x:
+            start = int(t.findtext('CharacterOffsetBegin'))
+            end = int(t.findtext('CharacterOffsetEnd'))
+            char_offsets.append( (start,end) )
+        sent_infos['char_offsets'] = char_offsets
+        deps_x = sent_x.find('.//' +deptype)
+        if deps_x is not None:
+            deps_j = []
+            for dep_x in deps_x.findall('.//dep'):
+                gov = dep_x.find('.//governor')
+                gi = int(gov.get('idx')) - 1 if gov.get('idx') is not None else int(gov.text) -1
+                dept= dep_x.find('.//dependent')
+                di = int(dept.get('idx')) - 1 if dept.get('idx') is not None else int(dept.text) -1
+                deps_j.append([dep_x.get('type'), gi,di])
+            sent_infos['deps'] = deps_j
+        if sent_x.findtext(".//parse") is not None:
+            parse = sent_x.findtext(".//parse").strip()
+            parse = re.sub(r'\s+', ' ', parse)
+            sent_infos['parse'] = parse
+        sents.append(sent_infos)
+    return sents
+
+def timeit(f, nodes, reps):
+    best = None
+    for r in range(reps):
+        t0 = time.time()
+        for n in nodes: f(n)
+        el = time.time() - t0
+        best = el if best is None else min(best, el)
+    return best
+
+def main():
+    filename = sys.argv[1]
+    maxdocs = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    nodes = []
+    for docstr in annogw2json.yield_annogw_docstr(annogw2json.smartopen(filename)):
+        doc_x = annogw2json.parse_docstr(docstr)
+        if doc_x is None: continue
+        sents_x = doc_x.find('sentences')
+        if sents_x is not None: nodes.append(sents_x)
+        if len(nodes) >= maxdocs: break
+    nsent = sum(len(n) for n in nodes)
+    ntok = sum(len(s.findall('.//token')) for n in nodes for s in n)
+    print "%d docs, %d sentences, %d tokens" % (len(nodes), nsent, ntok)
+
+    for n in nodes:
+        assert convert_sentences_xpath(n) == core2json.convert_corexml_sentences_fromnode(n)
+    print "outputs identical"
+
+    t_old = timeit(convert_sentences_xpath, nodes, 3)
+    t_new = timeit(core2json.convert_corexml_sentences_fromnode, nodes, 3)
+    print "xpath:  %.3fs  (%.0f tok/s)" % (t_old, ntok/t_old)
+    print "walker: %.3fs  (%.0f tok/s)" % (t_new, ntok/t_new)
+    print "speedup: %.2fx" % (t_old/t_new)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark parsetools.parse_sexpr against the old char-by-char version, on
+the HEADLINE/DATELINE and sentence parse strings of real AGW documents.
+Also checks they give the same trees and raise on the same strings.
+
+  python2.7 benchmarks/bench_sexpr.py gw/data/nyt_eng_199407.xml.gz [maxdocs]
+"""
+import sys,os,re,time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import annogw2json, parsetools
+from parsetools import BadSexpr
+
+def parse_sexpr_charloop(s, add_root=True):
+  """parse_sexpr as it was before the regex tokenizer: one Python-level step
+  per character, with a stack of open lists."""
+  first_paren = s.find('(')
+  if first_paren == -1:
+    raise BadSexpr("no paren")
+  s = s[first_paren:]
+  tree = []
+  stack = []
+  stack.append(tree)
+  curtok = ""
+  depth = 0
+  for c in s:
+    if c=='(':
+      new = []
+      stack[-1].append(new)
+      stack.append(new)
+      curtok = ""
+      depth += 1
+    elif c==')':
+      if curtok:
+        stack[-1].append(curtok)
+        curtok = ""
+      stack.pop()
+      curtok = ""
+      depth -= 1
+    elif c in (' ','\t','\r','\n'):
+      if curtok:
+        stack[-1].append(curtok)
+        curtok = ""
+    else:
+      curtok += c
+    if depth<0: raise BadSexpr("Too many closing parens")
+  if depth>0: raise BadSexpr("Didn't close all parens, depth %d" % depth)
+  root = tree[0]
+  if isinstance(root[0], list) and add_root:
+    root = ["ROOT"] + root
+  return root
+
+def outcome(f, s):
+    try:
+        return f(s)
+    except BadSexpr as e:
+        return ('BadSexpr', str(e))
+
+def timeit(f, strs, reps=3):
+    best = None
+    for r in range(reps):
+        t0 = time.time()
+        for s in strs:
+            try: f(s)
+            except BadSexpr: pass
+        el = time.time() - t0
+        best = el if best is None else min(best, el)
+    return best
+
+def main():
+    filename = sys.argv[1]
+    maxdocs = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    heads, sents = [], []
+    ndocs = 0
+    for docstr in annogw2json.yield_annogw_docstr(annogw2json.smartopen(filename)):
+        doc_x = annogw2json.parse_docstr(docstr)
+        if doc_x is None: continue
+        for tag in ['HEADLINE','DATELINE']:
+            s = doc_x.findtext(tag)
+            if s: heads.append(re.sub(r'\s+', ' ', annogw2json.convert_to_unicode(s)).strip())
+        for p in doc_x.iterfind('sentences/sentence/parse'):
+            sents.append(re.sub(r'\s+', ' ', p.text or '').strip())
+        ndocs += 1
+        if ndocs >= maxdocs: break
+
+    for name,strs in [('headline/dateline', heads), ('sentence', sents)]:
+        if not strs: continue
+        for s in strs:
+            assert outcome(parse_sexpr_charloop, s) == outcome(parsetools.parse_sexpr, s), repr(s)
+        nchar = sum(len(s) for s in strs)
+        t_old = timeit(parse_sexpr_charloop, strs)
+        t_new = timeit(parsetools.parse_sexpr, strs)
+        t_compact = timeit(parsetools.parse_sexpr_compact, strs)
+        print "%s parses: %d strings, %d chars, outputs identical" % (name, len(strs), nchar)
+        print "  charloop: %.3fs   regex: %.3fs (%.2fx)   regex+compact: %.3fs" % (
+                t_old, t_new, t_old/t_new, t_compact)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+End-to-end converter benchmarks on synthetic data (see synth_agw.py): wall
+time, throughput and peak RSS of each command, each run in its own process.
+
+  annogw2json full       AGW XML -> jdoc
+  annogw2json justsent   AGW XML -> justsent
+  core2json jdoc         CoreXML TSV -> jdoc
+  core2json jsent        CoreXML TSV -> jsent
+  sentjson2xml           justsent -> sentxml
+
+The inputs are generated once into --workdir (and reused if they already
+exist with the same size settings).  Results are printed as a table, and
+with --json appended to a file, one JSON object per run, so runs from
+different commits can be compared:
+
+  python2.7 benchmarks/run_bench.py --docs 500 --json bench.jsonl
+  python2.7 benchmarks/run_bench.py --docs 500 --compare bench.jsonl
+
+--compare takes the last run in the file as the baseline, and flags
+commands that got slower (or bigger) by more than --tolerance.
+"""
+import sys,os,time,json,subprocess,platform
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+PYTHON = sys.executable
+
+# name, script and args, input file key, output file key
+COMMANDS = [
+    ('annogw2json-full',     ['annogw2json.py', 'full'],     'agw',      'jdoc'),
+    ('annogw2json-justsent', ['annogw2json.py', 'justsent'], 'agw',      'justsent'),
+    ('core2json-jdoc',       ['core2json.py', 'jdoc'],       'corexml',  None),
+    ('core2json-jsent',      ['core2json.py', 'jsent'],      'corexml',  None),
+    ('sentjson2xml',         ['sentjson2xml.py'],            'justsent', None),
+]
+
+def generate_inputs(workdir, ndocs, nsents, ntokens, seed):
+    """Returns {key: path}.  justsent is filled in by the annogw2json-justsent run."""
+    tag = 'd%d_s%d_t%d_r%d' % (ndocs, nsents, ntokens, seed)
+    paths = {
+        'agw': os.path.join(workdir, 'synth_%s.xml' % tag),
+        'corexml': os.path.join(workdir, 'synth_%s.corexml.tsv' % tag),
+        'jdoc': os.path.join(workdir, 'synth_%s.jdoc' % tag),
+        'justsent': os.path.join(workdir, 'synth_%s.justsent' % tag),
+    }
+    gen = [PYTHON, os.path.join(HERE, 'synth_agw.py'), '--docs', str(ndocs),
+           '--sents', str(nsents), '--tokens', str(ntokens), '--seed', str(seed)]
+    for key, extra in [('agw', []), ('corexml', ['--corexml-tsv'])]:
+        if not os.path.exists(paths[key]):
+            print>>sys.stderr, "generating %s" % paths[key]
+            subprocess.check_call(gen + extra + ['-o', paths[key]])
+    return paths
+
+def run_one(argv, infile, outfile):
+    """Runs argv with stdin from infile and stdout to outfile (or /dev/null).
+    Returns (wall seconds, peak RSS in MB, exit status)."""
+    fin = open(infile, 'rb')
+    fout = open(outfile or os.devnull, 'wb')
+    ferr = open(os.devnull, 'wb')
+    t0 = time.time()
+    proc = subprocess.Popen(argv, stdin=fin, stdout=fout, stderr=ferr, cwd=ROOT)
+    # wait4 gives the rusage of just this child
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.time() - t0
+    for f in fin, fout, ferr: f.close()
+    # ru_maxrss is KB on Linux, bytes on OS X
+    kb = rusage.ru_maxrss / 1024.0 if sys.platform == 'darwin' else rusage.ru_maxrss
+    return elapsed, kb / 1024.0, status
+
+def run_benchmarks(paths, ndocs, repeat=1, only=None):
+    results = []
+    for name, args, in_key, out_key in COMMANDS:
+        if only and name not in only: continue
+        infile = paths[in_key]
+        if not os.path.exists(infile):
+            print>>sys.stderr, "skipping %s: no %s" % (name, infile)
+            continue
+        best = None
+        for r in range(repeat):
+            elapsed, rss, status = run_one([PYTHON] + args, infile,
+                                           paths[out_key] if out_key else None)
+            if status != 0:
+                print>>sys.stderr, "%s failed with status %d" % (name, status)
+                break
+            if best is None or elapsed < best[0]:
+                best = (elapsed, rss)
+        if best is None: continue
+        elapsed, rss = best
+        mb_in = os.path.getsize(infile) / 1e6
+        results.append({'name': name, 'secs': elapsed, 'peak_rss_mb': rss,
+                        'docs_per_sec': ndocs / elapsed, 'mb_in_per_sec': mb_in / elapsed})
+    return results
+
+def print_table(results, baseline=None, tolerance=0.1):
+    """Returns the number of regressions against baseline"""
+    base = dict((r['name'], r) for r in baseline['results']) if baseline else {}
+    nbad = 0
+    print "%-22s %9s %10s %10s %10s" % ('command', 'secs', 'docs/s', 'MB/s in', 'peakRSS MB')
+    for r in results:
+        line = "%-22s %9.2f %10.1f %10.2f %10.1f" % (
+                r['name'], r['secs'], r['docs_per_sec'], r['mb_in_per_sec'], r['peak_rss_mb'])
+        b = base.get(r['name'])
+        if b:
+            dt = r['secs'] / b['secs'] - 1
+            dm = r['peak_rss_mb'] / b['peak_rss_mb'] - 1
+            line += "   time %+5.1f%%  rss %+5.1f%%" % (100*dt, 100*dm)
+            if dt > tolerance or dm > tolerance:
+                line += "  REGRESSION"
+                nbad += 1
+        print line
+    return nbad
+
+def load_last_run(path):
+    last = None
+    for line in open(path):
+        if line.strip():
+            last = json.loads(line)
+    return last
+
+def main():
+    import argparse; p = argparse.ArgumentParser()
+    p.add_argument('--docs', type=int, default=500)
+    p.add_argument('--sents', type=int, default=20, help="mean sentences per document")
+    p.add_argument('--tokens', type=int, default=25, help="mean tokens per sentence")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--workdir', default='/tmp/gigaword_bench')
+    p.add_argument('--repeat', type=int, default=1, help="runs per command; the fastest counts")
+    p.add_argument('--only', type=lambda s: s.split(','),
+            help="comma-separated commands, from: " + ','.join(c[0] for c in COMMANDS))
+    p.add_argument('--json', help="append this run's results to this file")
+    p.add_argument('--compare', help="compare against the last run in this file")
+    p.add_argument('--tolerance', type=float, default=0.1,
+            help="with --compare, flag slowdowns or RSS growth above this fraction")
+    args = p.parse_args()
+
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+    paths = generate_inputs(args.workdir, args.docs, args.sents, args.tokens, args.seed)
+    results = run_benchmarks(paths, args.docs, args.repeat, args.only)
+
+    baseline = load_last_run(args.compare) if args.compare else None
+    nbad = print_table(results, baseline, args.tolerance)
+
+    if args.json:
+        rev = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=open(os.devnull, 'w')).communicate()[0].strip()
+        run = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'rev': rev or None,
+               'python': platform.python_version(), 'docs': args.docs,
+               'sents': args.sents, 'tokens': args.tokens, 'results': results}
+        with open(args.json, 'a') as f:
+            f.write(json.dumps(run, sort_keys=True) + '\n')
+    if nbad:
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
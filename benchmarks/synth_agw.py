@@ -0,0 +1,224 @@
+"""
+Synthetic Annotated Gigaword data, for benchmarking without the LDC release.
+
+Writes one AGW-style file: <FILE> of <DOC id=... type=...> elements, each with
+HEADLINE and DATELINE parse strings, TEXT, <sentences> (tokens with word,
+lemma, offsets, POS, NER; parse; basic and collapsed-ccprocessed
+dependencies) and <coreferences>.  The content is random but the layout
+follows the real files, including the line breaks inside HEADLINE parses,
+multi-line <parse> strings and XML-escaped tokens, so it exercises the same
+code paths.  Output is deterministic for a given --seed.
+
+With --corexml-tsv, instead writes the same documents as CoreNLP XML, one
+per line as "docid \\t xml", which is core2json.py's TSV input.
+
+  python2.7 benchmarks/synth_agw.py --docs 2000 > synth_eng_199407.xml
+  python2.7 benchmarks/synth_agw.py --docs 2000 -o synth_eng_199407.xml.gz
+  python2.7 benchmarks/synth_agw.py --docs 2000 --corexml-tsv > synth.corexml.tsv
+"""
+import sys,random,gzip
+from xml.sax.saxutils import escape
+
+# (word, lemma, POS); a few with characters that need escaping or are non-ASCII
+LEXICON = {
+    'DT':  [('the','the'), ('a','a'), ('this','this'), ('some','some')],
+    'NN':  [('market','market'), ('company','company'), ('year','year'), ('plan','plan'),
+            ('caf\xc3\xa9','caf\xc3\xa9'), ('report','report'), ('price','price')],
+    'NNS': [('officials','official'), ('shares','share'), ('owners','owner'), ('talks','talk')],
+    'NNP': [('Smith','Smith'), ('Clinton','Clinton'), ('Boston','Boston'), ('AT&T','AT&T'),
+            ('Monday','Monday'), ('Congress','Congress'), ('Jos\xc3\xa9','Jos\xc3\xa9')],
+    'PRP': [('they','they'), ('he','he'), ('it','it')],
+    'VBD': [('said','say'), ('rose','rise'), ('announced','announce'), ('agreed','agree')],
+    'VBZ': [('says','say'), ('expects','expect'), ('is','be')],
+    'JJ':  [('new','new'), ('federal','federal'), ('strong','strong'), ('<big>','<big>')],
+    'IN':  [('in','in'), ('of','of'), ('on','on'), ('for','for')],
+    'CD':  [('1994','1994'), ('three','three'), ('10','10')],
+}
+NER_FOR = {'NNP': ['PERSON', 'LOCATION', 'ORGANIZATION', 'DATE'], 'CD': ['NUMBER', 'DATE']}
+DEP_TYPES = ['nsubj', 'dobj', 'det', 'amod', 'prep_in', 'prep_of', 'nn', 'num', 'poss', 'conj_and']
+DOC_TYPES = ['story'] * 8 + ['multi', 'advis']
+
+## Sentences
+
+def make_phrase(rng, label):
+    """A list of (word, lemma, pos) for one NP/VP/PP"""
+    if label == 'NP':
+        tags = rng.choice([['DT','NN'], ['NNP'], ['NNP','NNP'], ['DT','JJ','NNS'], ['PRP'], ['CD','NNS']])
+    elif label == 'VP':
+        tags = [rng.choice(['VBD','VBZ'])]
+    else:
+        tags = ['IN', rng.choice(['NNP','NN'])]
+    return [rng.choice(LEXICON[t]) + (t,) for t in tags]
+
+def make_sentence(rng, mean_len):
+    """Returns (phrases, tokens): phrases is [(label, [token index])], tokens
+    is [(word, lemma, pos)], ending in a period."""
+    target = max(3, int(rng.gauss(mean_len, mean_len/3.0)))
+    phrases, tokens = [], []
+    labels = ['NP', 'VP']
+    while len(tokens) < target:
+        labels.append(rng.choice(['NP', 'PP', 'PP', 'NP']))
+        label = labels[len(phrases)]
+        toks = make_phrase(rng, label)
+        phrases.append((label, range(len(tokens), len(tokens)+len(toks))))
+        tokens += toks
+    tokens.append(('.', '.', '.'))
+    return phrases, tokens
+
+def parse_string(phrases, tokens, linebreaks=False):
+    parts = []
+    for label, idxs in phrases:
+        leaves = ' '.join('(%s %s)' % (tokens[i][2], tokens[i][0]) for i in idxs)
+        parts.append('(%s %s)' % (label, leaves))
+    parts.append('(. .)')
+    # the real parses are pretty-printed across lines
+    sep = '\n    ' if linebreaks else ' '
+    return '(ROOT (S ' + sep.join(parts) + '))'
+
+def make_deps(rng, n):
+    """[(type, governor, dependent)], 1-based, each token but one attached"""
+    root = rng.randint(1, n)
+    deps = []
+    for i in range(1, n+1):
+        if i == root: continue
+        deps.append((rng.choice(DEP_TYPES), rng.randint(1, n) if n > 1 else root, i))
+    return deps
+
+## Writing XML
+
+def token_xml(out, i, tok, start, ner):
+    word, lemma, pos = tok
+    out.append('<token id="%d">' % i)
+    out.append('<word>%s</word>' % escape(word))
+    out.append('<lemma>%s</lemma>' % escape(lemma))
+    out.append('<CharacterOffsetBegin>%d</CharacterOffsetBegin>' % start)
+    out.append('<CharacterOffsetEnd>%d</CharacterOffsetEnd>' % (start + len(word.decode('utf8'))))
+    out.append('<POS>%s</POS>' % pos)
+    out.append('<NER>%s</NER>' % ner)
+    out.append('</token>')
+
+def deps_xml(out, tag, deps):
+    out.append('<%s>' % tag)
+    for t,g,d in deps:
+        out.append('<dep type="%s">' % t)
+        out.append('<governor>%d</governor>' % g)
+        out.append('<dependent>%d</dependent>' % d)
+        out.append('</dep>')
+    out.append('</%s>' % tag)
+
+def sentences_xml(out, rng, sents, multiline=True):
+    """Appends <sentences>; returns the raw text"""
+    out.append('<sentences>')
+    offset = 0
+    text = []
+    for si,(phrases, tokens) in enumerate(sents):
+        out.append('<sentence id="%d">' % (si+1))
+        out.append('<tokens>')
+        for ti,tok in enumerate(tokens):
+            ner = rng.choice(NER_FOR[tok[2]]) if tok[2] in NER_FOR and rng.random() < 0.7 else 'O'
+            token_xml(out, ti+1, tok, offset, ner)
+            offset += len(tok[0].decode('utf8')) + 1
+        out.append('</tokens>')
+        out.append('<parse>%s </parse>' % escape(parse_string(phrases, tokens, linebreaks=multiline and si % 3 == 0)))
+        deps = make_deps(rng, len(tokens))
+        deps_xml(out, 'basic-dependencies', deps)
+        deps_xml(out, 'collapsed-ccprocessed-dependencies', deps)
+        out.append('</sentence>')
+        text.append(' '.join(t[0] for t in tokens))
+    out.append('</sentences>')
+    return text
+
+def coref_xml(out, rng, sents, tag, nchains=None):
+    """Entities with 2-4 mentions, each mention an NP of some sentence.
+    nchains defaults to a random number up to half the sentences."""
+    nps = [(si+1, idxs) for si,(phrases,tokens) in enumerate(sents)
+           for label,idxs in phrases if label == 'NP']
+    if len(nps) < 2: return
+    out.append('<%s>' % tag)
+    if nchains is None:
+        nchains = rng.randint(1, max(1, len(sents)//2))
+    for e in range(nchains):
+        mentions = sorted(rng.sample(nps, min(len(nps), rng.randint(2, 4))))
+        out.append('<coreference>')
+        for mi,(si,idxs) in enumerate(mentions):
+            out.append('<mention representative="true">' if mi == 0 else '<mention>')
+            out.append('<sentence>%d</sentence>' % si)
+            out.append('<start>%d</start>' % (idxs[0]+1))
+            out.append('<end>%d</end>' % (idxs[-1]+2))
+            out.append('<head>%d</head>' % (idxs[-1]+1))
+            out.append('</mention>')
+        out.append('</coreference>')
+    out.append('</%s>' % tag)
+
+def make_doc_sents(rng, mean_sents, mean_len):
+    nsents = max(1, int(rng.gauss(mean_sents, mean_sents/2.0)))
+    return [make_sentence(rng, mean_len) for i in range(nsents)]
+
+def agw_doc(rng, docid, mean_sents, mean_len):
+    out = ['<DOC id="%s" type="%s" >' % (docid, rng.choice(DOC_TYPES))]
+    phrases, tokens = make_sentence(rng, 6)
+    out += ['<HEADLINE>', escape(parse_string(phrases, tokens[:-1], linebreaks=True)), '</HEADLINE>']
+    if rng.random() < 0.6:
+        out += ['<DATELINE>', '(NP (NNP BOSTON))', '</DATELINE>']
+    sents = make_doc_sents(rng, mean_sents, mean_len)
+    body = []
+    text = sentences_xml(body, rng, sents)
+    out += ['<TEXT>', '<P>'] + [escape(t) for t in text] + ['</P>', '</TEXT>']
+    out += body
+    coref_xml(out, rng, sents, 'coreferences')
+    out.append('</DOC>')
+    return '\n'.join(out) + '\n'
+
+def corexml_doc(rng, mean_sents, mean_len):
+    sents = make_doc_sents(rng, mean_sents, mean_len)
+    out = ['<?xml version="1.0" encoding="UTF-8"?>', '<root><document>']
+    # one line per document, so no line breaks inside the parses
+    sentences_xml(out, rng, sents, multiline=False)
+    coref_xml(out, rng, sents, 'coreference')
+    out.append('</document></root>')
+    return ''.join(out)
+
+def docids(basename, ndocs):
+    """NYT_ENG_19940701.0001 etc., 100 docs a day"""
+    prefix = basename[:-6].upper()
+    month = basename[-6:]
+    for i in range(ndocs):
+        yield "%s%s%02d.%04d" % (prefix, month, i//100 % 28 + 1, i % 100 + 1)
+
+def write_agw(out, ndocs, basename='synth_eng_199407', seed=0, mean_sents=20, mean_len=25):
+    rng = random.Random(seed)
+    out.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+    out.write('<FILE id="%s">\n' % basename)
+    for docid in docids(basename, ndocs):
+        out.write(agw_doc(rng, docid, mean_sents, mean_len))
+    out.write('</FILE>\n')
+
+def write_corexml_tsv(out, ndocs, basename='synth_eng_199407', seed=0, mean_sents=20, mean_len=25):
+    rng = random.Random(seed)
+    for docid in docids(basename, ndocs):
+        out.write("%s\t%s\n" % (docid, corexml_doc(rng, mean_sents, mean_len)))
+
+def main():
+    import argparse; p = argparse.ArgumentParser()
+    p.add_argument('--docs', type=int, default=1000)
+    p.add_argument('--sents', type=int, default=20, help="mean sentences per document")
+    p.add_argument('--tokens', type=int, default=25, help="mean tokens per sentence")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--basename', default='synth_eng_199407',
+            help="FILE id; docids are made from it, e.g. SYNTH_ENG_19940701.0001")
+    p.add_argument('--corexml-tsv', action='store_true',
+            help="write core2json's TSV input instead of AGW XML")
+    p.add_argument('-o', '--output', help="output file; gzipped if it ends in .gz (default: stdout)")
+    args = p.parse_args()
+    if args.output is None:
+        out = sys.stdout
+    elif args.output.endswith('.gz'):
+        out = gzip.open(args.output, 'wb')
+    else:
+        out = open(args.output, 'w')
+    fn = write_corexml_tsv if args.corexml_tsv else write_agw
+    fn(out, args.docs, args.basename, args.seed, args.sents, args.tokens)
+    out.close()
+
+if __name__=='__main__':
+    main()
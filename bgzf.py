@@ -0,0 +1,205 @@
+"""
+Seekable block-gzip output, in the style of BGZF (as used for BAM files).
+
+The output is a series of independent gzip members ("blocks"), so zcat and
+gzip.open read it as one ordinary stream.  Each write() call is kept whole
+inside one block; the converters write one document (or sentence) per call,
+so blocks always end on record boundaries.  Each member's gzip header has an
+extra subfield 'BL' holding the member's total compressed size, so block
+boundaries can be found without decompressing, and blocks can be
+decompressed independently, in parallel.  As in BGZF, a finished file ends
+with an empty member, so even a file with no data is valid gzip, and one
+that was cut short can be told from a complete one ('bgzf.py blocks' shows
+the empty member last).
+
+A position in the file is a "virtual offset":
+    (compressed offset of the block's start) << 32  |  offset inside the block
+which is what the docid indexes (docindex.py) store for .gz outputs.
+
+Commandline:
+  # print the block table: compressed offset, compressed size, uncompressed size
+  python bgzf.py blocks x.jdoc.gz
+  # decompress using several processes
+  python bgzf.py cat x.jdoc.gz 8
+"""
+import sys,struct,zlib
+
+DEFAULT_BLOCK_SIZE = 1<<16
+
+# ID1 ID2 CM FLG(FEXTRA) MTIME XFL OS XLEN, then subfield 'BL' with 4 bytes
+_HEADER_FMT = '<4sIBBH2sHI'
+_HEADER_SIZE = struct.calcsize(_HEADER_FMT)
+_TRAILER_SIZE = 8
+
+def make_voffset(coffset, uoffset):
+    return (coffset << 32) | uoffset
+
+def split_voffset(voffset):
+    return voffset >> 32, voffset & 0xffffffff
+
+class BlockGzipWriter(object):
+    """File-like writer.  Buffers whole write() calls until block_size is
+    reached, then compresses them as one gzip member."""
+    def __init__(self, f, block_size=DEFAULT_BLOCK_SIZE, level=6):
+        self.f = f
+        self.block_size = block_size
+        self.level = level
+        self.buf = []
+        self.buf_size = 0
+        self.coffset = 0
+
+    def tell_virtual(self):
+        """Virtual offset at which the next write() will start."""
+        if self.buf_size >= self.block_size:
+            self.flush_block()
+        return make_voffset(self.coffset, self.buf_size)
+
+    def write(self, data):
+        if self.buf_size >= self.block_size:
+            self.flush_block()
+        self.buf.append(data)
+        self.buf_size += len(data)
+
+    def flush_block(self, force=False):
+        if not self.buf and not force: return
+        data = ''.join(self.buf)
+        c = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        cdata = c.compress(data) + c.flush()
+        member_size = _HEADER_SIZE + len(cdata) + _TRAILER_SIZE
+        header = struct.pack(_HEADER_FMT, '\x1f\x8b\x08\x04', 0, 0, 0xff, 8,
+                             'BL', 4, member_size)
+        trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+        self.f.write(header + cdata + trailer)
+        self.coffset += member_size
+        self.buf = []
+        self.buf_size = 0
+
+    def flush(self):
+        self.flush_block()
+        self.f.flush()
+
+    def sync(self):
+        """Flushes the finished blocks to the file but leaves the current
+        block open, so block boundaries don't depend on when this is called.
+        Returns the current block's data; resume_at() puts it back."""
+        self.f.flush()
+        return ''.join(self.buf)
+
+    def finish(self):
+        """Ends the last block and writes the empty end-of-file member"""
+        self.flush_block()
+        self.flush_block(force=True)
+        self.f.flush()
+
+    def resume_at(self, coffset, pending=''):
+        """Continue a file whose finished blocks end at coffset, with
+        'pending' (from sync()) as the current block so far"""
+        self.coffset = coffset
+        self.buf = [pending] if pending else []
+        self.buf_size = len(pending)
+
+    def close(self):
+        self.finish()
+        self.f.close()
+
+## Reading
+
+def read_member_size(header):
+    magic, mtime, xfl, os_, xlen, si, slen, member_size = struct.unpack(_HEADER_FMT, header)
+    if magic != '\x1f\x8b\x08\x04' or si != 'BL':
+        raise ValueError("not a block-gzip member")
+    return member_size
+
+def is_block_gzip(f):
+    """Whether the seekable file f starts with a block-gzip member"""
+    header = f.read(_HEADER_SIZE)
+    f.seek(0)
+    try:
+        read_member_size(header)
+        return True
+    except (ValueError, struct.error):
+        return False
+
+def decompress_member(member):
+    return zlib.decompress(member, 16 + zlib.MAX_WBITS)
+
+def read_block(f, coffset):
+    """Decompressed contents of the block starting at coffset."""
+    f.seek(coffset)
+    header = f.read(_HEADER_SIZE)
+    member_size = read_member_size(header)
+    return decompress_member(header + f.read(member_size - _HEADER_SIZE))
+
+def read_at(f, voffset, length):
+    """'length' bytes starting at a virtual offset.  Records written by a
+    single write() call never cross blocks."""
+    coffset, uoffset = split_voffset(voffset)
+    return read_block(f, coffset)[uoffset:uoffset+length]
+
+def iter_members(f):
+    """Yields (coffset, raw member bytes), reading headers only to find
+    boundaries."""
+    coffset = 0
+    while True:
+        header = f.read(_HEADER_SIZE)
+        if not header: return
+        member_size = read_member_size(header)
+        yield coffset, header + f.read(member_size - _HEADER_SIZE)
+        coffset += member_size
+
+def iter_blocks(f, workers=1):
+    """Yields decompressed blocks in file order, decompressing with a process
+    pool if workers > 1."""
+    members = (m for c,m in iter_members(f))
+    if workers <= 1:
+        for m in members:
+            yield decompress_member(m)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        for block in pool.imap(decompress_member, members, chunksize=4):
+            yield block
+    finally:
+        pool.terminate()
+
+def iter_lines(f, workers=1):
+    """Lines of the decompressed file.  Assumes blocks end on line
+    boundaries, as the converters write them."""
+    for block in iter_blocks(f, workers):
+        lines = block.split('\n')
+        last = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if last:
+            yield last
+
+##########################################
+
+def run_blocks(filename):
+    "Print the block table: compressed offset, compressed size, uncompressed size"
+    f = open(filename, 'rb')
+    for coffset, member in iter_members(f):
+        isize, = struct.unpack('<I', member[-4:])
+        print "%d\t%d\t%d" % (coffset, len(member), isize)
+
+def run_cat(filename, workers=1):
+    "Decompress to stdout, optionally with several worker processes"
+    for block in iter_blocks(open(filename, 'rb'), workers):
+        sys.stdout.write(block)
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Block-gzip files (see bgzf.py)")
+    sub = p.add_subparsers()
+    c = sub.add_parser('blocks', help=run_blocks.__doc__)
+    c.add_argument('filename')
+    c.set_defaults(func=run_blocks)
+    c = sub.add_parser('cat', help=run_cat.__doc__)
+    c.add_argument('filename')
+    c.add_argument('workers', nargs='?', type=int, default=1)
+    c.set_defaults(func=run_cat)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Convert a whole directory of AGW .xml.gz files with one command, instead of
+make -j plus PBS scripts.
+
+Files are converted in a pool of worker processes, one file per task,
+largest first, so a few huge months don't end up running alone at the end.
+The workers stay up for the whole run, so interpreter startup and imports
+happen once per worker, not once per file.  Each file is converted exactly
+as 'zcat X.xml.gz | annogw2json.py --emit ... --output-prefix X' would.
+
+A file is skipped if it is up to date: its PREFIX.convertall.done marker is
+newer than the input and records the same formats and options.  Killed
+jobs resume from their checkpoints (see annogw2json.py --resume).
+
+At the end, a JSON report is written (default OUTDIR/convertall_report.json)
+with per-file status, timings and document counts, and run totals.  Each
+file also gets a PREFIX.docstats summary (document types, sentence/token/
+entity totals; see docstats.py) for corpus-wide reports.
+
+  python2.7 convertall.py gw/data --emit jdoc,justsent,meta,docid,sentxml --index --workers 30
+"""
+import sys,os,glob,time,json,subprocess,traceback
+import multiprocessing
+import annogw2json
+import convstats
+import jsonio
+
+DONE_SUFFIX = '.convertall.done'
+
+def output_prefix(path, outdir):
+    base = os.path.basename(path)
+    for ext in ['.gz', '.xml']:
+        if base.endswith(ext): base = base[:-len(ext)]
+    return os.path.join(outdir or os.path.dirname(path), base)
+
+def options_record(opts):
+    """The options that change what gets written"""
+    return {'emit': sorted(opts['emit']), 'index': opts['index'], 'bgzf': opts['bgzf'],
+            'label_codes': opts['label_codes']}
+
+def is_up_to_date(path, prefix, opts):
+    done = prefix + DONE_SUFFIX
+    if not os.path.exists(done) or os.path.getmtime(done) < os.path.getmtime(path):
+        return False
+    try:
+        if json.load(open(done)) != options_record(opts):
+            return False
+    except ValueError:
+        return False
+    return os.path.exists(annogw2json.doc_stats_path(prefix)) and \
+           all(os.path.exists(annogw2json.output_path(prefix, fmt, opts['bgzf']))
+               for fmt in opts['emit'])
+
+def open_input(path):
+    """Decompressing in a separate zcat process, as the Makefile did, is
+    faster than python's gzip module.  Returns (stream, process or None)."""
+    if not path.endswith('.gz'):
+        return open(path), None
+    try:
+        proc = subprocess.Popen(['gzip', '-dc', path], stdout=subprocess.PIPE, bufsize=1<<20)
+        return proc.stdout, proc
+    except OSError:
+        return annogw2json.smartopen(path), None
+
+def checked_lines(stream, proc, path):
+    """The lines of a gzip -dc process's output.  Its exit status is
+    checked at the end of the input, so a truncated or corrupt file fails
+    before the conversion is finished (and checkpointed as finished)."""
+    for line in stream:
+        yield line
+    if proc.wait() != 0:
+        raise IOError("gzip -dc %s exited with status %d" % (path, proc.returncode))
+
+## Worker side
+
+def init_worker(opts):
+    annogw2json.collect_doc_stats = True
+    if opts['label_codes']:
+        import labelcodes
+        annogw2json.label_coder = labelcodes.LabelCoder()
+    if opts['cache']:
+        import doccache
+        annogw2json.doc_cache = doccache.DocCache(opts['cache'], annogw2json.cache_options())
+
+def convert_file(task):
+    """Returns a report dict for one input file"""
+    path, prefix, opts = task
+    r = {'input': path, 'prefix': prefix, 'bytes_in': os.path.getsize(path)}
+    t0 = time.time()
+    writer = proc = None
+    try:
+        writer, skip_docs = annogw2json.open_emit_writer(prefix, opts['emit'], opts['index'],
+                opts['bgzf'], checkpoint=True, resume=True, checkpoint_secs=opts['checkpoint_secs'],
+                doc_stats_file=annogw2json.doc_stats_path(prefix))
+        if writer is not None:
+            convstats.active = convstats.Stats(label=prefix, report_secs=float('inf'))
+            stream, proc = open_input(path)
+            if proc is not None:
+                stream = checked_lines(stream, proc, path)
+            annogw2json.process_stream(stream, emit=opts['emit'], writer=writer, skip_docs=skip_docs)
+            summary = convstats.active.summary()
+            convstats.active = None
+            r['counts'] = summary['counts']
+            r['stages'] = summary['stages']
+            r['resumed_after_docs'] = skip_docs
+        json.dump(options_record(opts), open(prefix + DONE_SUFFIX, 'w'))
+        r['status'] = 'converted'
+    except Exception:
+        r['status'] = 'failed'
+        r['error'] = traceback.format_exc()
+        convstats.active = None
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if writer is not None:
+            writer.abandon()
+    r['secs'] = time.time() - t0
+    return r
+
+## Driver
+
+def find_inputs(datadir, pattern='*.xml.gz'):
+    """Input files, largest first"""
+    paths = glob.glob(os.path.join(datadir, pattern))
+    return sorted(paths, key=lambda p: -os.path.getsize(p))
+
+def run(datadir, opts, workers, outdir=None, pattern='*.xml.gz', force=False, log=sys.stderr):
+    """Returns the run report"""
+    t0 = time.time()
+    files, tasks = [], []
+    for path in find_inputs(datadir, pattern):
+        prefix = output_prefix(path, outdir)
+        if not force and is_up_to_date(path, prefix, opts):
+            files.append({'input': path, 'prefix': prefix, 'status': 'up to date',
+                          'bytes_in': os.path.getsize(path)})
+        else:
+            # a checkpoint only applies to the input and outputs it was made
+            # for, and older ones without document stats can't be continued
+            ckpt = annogw2json.checkpoint_path(prefix)
+            if os.path.exists(ckpt):
+                state = annogw2json.load_checkpoint(prefix)
+                if (force or state is None or os.path.getmtime(ckpt) < os.path.getmtime(path) or 'doc_stats' not in state
+                        or not annogw2json.checkpoint_matches(state, opts['emit'], opts['index'], opts['bgzf'])):
+                    os.remove(ckpt)
+            tasks.append((path, prefix, opts))
+    print>>log, "%d files to convert, %d up to date, %d workers" % (
+            len(tasks), len(files), workers)
+    if tasks:
+        pool = multiprocessing.Pool(min(workers, len(tasks)), init_worker, (opts,))
+        try:
+            for i,r in enumerate(pool.imap_unordered(convert_file, tasks)):
+                files.append(r)
+                docs = r.get('counts', {}).get('docs', 0)
+                print>>log, "[%d/%d] %s %s in %.0fs (%d docs)" % (
+                        i+1, len(tasks), r['status'], r['input'], r['secs'], docs)
+                if r['status'] == 'failed':
+                    print>>log, r['error']
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    elapsed = time.time() - t0
+    totals = {}
+    for r in files:
+        totals[r['status']] = totals.get(r['status'], 0) + 1
+        for k,v in r.get('counts', {}).items():
+            totals[k] = totals.get(k, 0) + v
+    return {'datadir': datadir, 'outdir': outdir, 'workers': workers,
+            'options': options_record(opts), 'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t0)),
+            'elapsed': elapsed, 'totals': totals,
+            'docs_per_sec': totals.get('docs', 0) / elapsed if elapsed else 0,
+            'files': files}
+
+def main():
+    import argparse; p = argparse.ArgumentParser()
+    p.add_argument('datadir', help="directory of AGW .xml.gz files")
+    p.add_argument('--emit', type=lambda s: s.split(','), default=['jdoc'],
+            help="comma-separated output formats, from: " + ','.join(annogw2json.EMIT_FORMATS))
+    p.add_argument('--outdir', help="where outputs go (default: next to the inputs)")
+    p.add_argument('--pattern', default='*.xml.gz', help="input filename glob (default %(default)s)")
+    p.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    p.add_argument('--index', action='store_true', help="also write docid indexes")
+    p.add_argument('--bgzf', action='store_true', help="write seekable block-gzip outputs")
+    p.add_argument('--label-codes', action='store_true', help="integer-coded labels in jdoc")
+    p.add_argument('--cache', metavar='DIR', help="converted-document cache (see doccache.py)")
+    p.add_argument('--checkpoint-secs', type=float, default=120)
+    p.add_argument('--force', action='store_true', help="reconvert even up-to-date files")
+    p.add_argument('--report', help="run report path (default OUTDIR/convertall_report.json)")
+    args = p.parse_args()
+    bad = [f for f in args.emit if f not in annogw2json.EMIT_FORMATS]
+    if bad: p.error("unknown --emit format(s): " + ','.join(bad))
+    if jsonio.env_error: p.error(jsonio.env_error)
+    if args.outdir and not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    opts = {'emit': args.emit, 'index': args.index, 'bgzf': args.bgzf,
+            'label_codes': args.label_codes, 'cache': args.cache,
+            'checkpoint_secs': args.checkpoint_secs}
+    report = run(args.datadir, opts, args.workers, args.outdir, args.pattern, args.force)
+    report_path = args.report or os.path.join(args.outdir or args.datadir, 'convertall_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    t = report['totals']
+    print>>sys.stderr, "%d converted, %d up to date, %d failed; %d docs in %.0fs (%.1f docs/sec). Report: %s" % (
+            t.get('converted', 0), t.get('up to date', 0), t.get('failed', 0),
+            t.get('docs', 0), report['elapsed'], report['docs_per_sec'], report_path)
+    if t.get('failed'):
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
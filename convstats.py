@@ -0,0 +1,132 @@
+"""
+Throughput and per-stage timing for the converters' --stats mode.
+
+Stages nest: push('split') ... push('read') ... pop() ... pop() charges the
+reading time to 'read' and only the rest to 'split', so stage times are
+exclusive and add up to (at most) the wall-clock time.  In multiprocess
+runs, worker stage times are added in too, so they can exceed wall time.
+
+Progress lines go to stderr every report_secs.  summary() is a dict for
+the machine-readable report written at exit, one JSON object per run:
+    {"label":..., "elapsed":..., "counts":{...}, "rates":{...}, "stages":{...}}
+"""
+import sys,time,json
+from collections import defaultdict
+
+# the Stats for this process's run, when stats are on.  the converters call
+# the module-level functions below, which do nothing when it's None.
+active = None
+
+def stage_start(name):
+    if active is not None: active.push(name)
+
+def stage_end():
+    if active is not None: active.pop()
+
+def count(name, n=1):
+    if active is not None: active.count(name, n)
+
+class Stats(object):
+    def __init__(self, label=None, report_secs=10, out=sys.stderr):
+        self.label = label
+        self.report_secs = report_secs
+        self.out = out
+        self.start_time = self.last_report = self.mark = time.time()
+        self.counts = defaultdict(int)
+        self.stage_secs = defaultdict(float)
+        self.stack = []
+
+    def push(self, stage):
+        now = time.time()
+        if self.stack:
+            self.stage_secs[self.stack[-1]] += now - self.mark
+        self.stack.append(stage)
+        self.mark = now
+
+    def pop(self):
+        now = time.time()
+        self.stage_secs[self.stack.pop()] += now - self.mark
+        self.mark = now
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def merge(self, other_summary):
+        """Add in the counts and stage times from another Stats' summary()
+        (e.g. from a worker process)."""
+        for k,v in other_summary['counts'].items():
+            self.counts[k] += v
+        for k,v in other_summary['stages'].items():
+            self.stage_secs[k] += v
+
+    def maybe_report(self):
+        now = time.time()
+        if now - self.last_report >= self.report_secs:
+            self.last_report = now
+            self.out.write(self.progress_line(now) + '\n')
+
+    def progress_line(self, now=None):
+        elapsed = (now or time.time()) - self.start_time
+        c = self.counts
+        return "[stats] %.0fs  %d docs (%.1f/s)  %d sents (%.1f/s)  in %.1fMB  out %.1fMB" % (
+                elapsed, c['docs'], c['docs']/elapsed, c['sentences'], c['sentences']/elapsed,
+                c['bytes_in']/1e6, c['bytes_out']/1e6)
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        return {
+            'label': self.label,
+            'elapsed': elapsed,
+            'counts': dict(self.counts),
+            'rates': dict((k+'_per_sec', v/elapsed) for k,v in self.counts.items()),
+            'stages': dict(self.stage_secs),
+        }
+
+    def write_summary(self, f=None):
+        """Final progress line and stage breakdown to stderr; the JSON
+        summary to f (default: stderr, on a line starting with STATS)."""
+        s = self.summary()
+        self.out.write(self.progress_line() + '\n')
+        total = sum(s['stages'].values()) or 1
+        for stage,secs in sorted(s['stages'].items(), key=lambda x: -x[1]):
+            self.out.write("[stats]   %-10s %8.2fs  %5.1f%%\n" % (stage, secs, 100*secs/total))
+        caches = set(k.rsplit('_', 1)[0] for k in s['counts'] if k.endswith('_hits') or k.endswith('_misses'))
+        for name in sorted(caches):
+            hits, misses = s['counts'].get(name+'_hits', 0), s['counts'].get(name+'_misses', 0)
+            self.out.write("[stats]   %s: %d hits, %d misses (%.1f%% hits)\n" % (
+                    name, hits, misses, 100.0*hits/((hits+misses) or 1)))
+        if f is None:
+            self.out.write("STATS\t%s\n" % json.dumps(s, sort_keys=True))
+        else:
+            f.write(json.dumps(s, sort_keys=True) + '\n')
+
+class TimedLines(object):
+    """Wraps an input line iterator, charging reading (and gunzip, when the
+    stream decompresses) to the 'read' stage and counting bytes_in."""
+    def __init__(self, stream, stats):
+        self.it = iter(stream)
+        self.stats = stats
+    def __iter__(self):
+        return self
+    def next(self):
+        self.stats.push('read')
+        try:
+            line = next(self.it)
+        finally:
+            self.stats.pop()
+        self.stats.counts['bytes_in'] += len(line)
+        return line
+
+class TimedWriter(object):
+    """Wraps an output file, charging write() to the 'write' stage and
+    counting bytes_out.  Other attributes go to the wrapped file."""
+    def __init__(self, f, stats):
+        self.f = f
+        self.stats = stats
+    def write(self, data):
+        self.stats.push('write')
+        self.f.write(data)
+        self.stats.pop()
+        self.stats.counts['bytes_out'] += len(data)
+    def __getattr__(self, name):
+        return getattr(self.f, name)
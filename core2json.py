@@ -16,6 +16,9 @@ DeepInfo has 'sentences' and 'entities':
  * list of entities (and
 relations? etc.) for deeper processing.
 
+'jcol' is a binary, columnar version of jdoc (see jcolumnar.py).  It has no
+ShallowInfo field, since that is just the tokens again.
+
 There's also a 'jsent' format (one line per sentence):
     DocID \t SentID \t Text \t SentInfo
 where SentInfo is JSON, and the others are strings.
@@ -24,6 +27,8 @@ Currently 'Text' is a space-tokenized version of the text.
 In 'jsent', discourse-level info is awkward to include.
 Currently entities are encoded as separate records.
     DocID \t EntID \t EntInfo
+With --output-prefix, sentences and entities go to separate files, sharded
+by docid with --shards (see JsentShardWriter).
 
 Commandline usage is stdin/stdout.
 
@@ -33,17 +38,8 @@ This script converts everything to 0-indexed for convenience.
 """
 import sys,os,re,itertools
 import xml.etree.ElementTree as ET
-import json
-
-try:
-    import ujson
-    def mydumps(x, *args, **kwargs):
-        # README on https://github.com/esnme/ultrajson
-        kwargs['ensure_ascii'] = False
-        return ujson.dumps(x, *args, **kwargs)
-except ImportError:
-    def mydumps(x, *args, **kwargs):
-        return json.dumps(x, separators=(',',':'), *args, **kwargs)
+import jsonio
+import convstats
 
 def convert_to_unicode(mystr):
     if isinstance(mystr, unicode):
@@ -59,30 +55,60 @@ def convert_corexml_sentences(doc_x, **kwargs):
     sents_x = doc_x.find('document').find('sentences')
     return convert_corexml_sentences_fromnode(sents_x, **kwargs)
 
+# POS, NER and dependency labels come from small closed sets.  The XML
+# parser makes a new string object for every occurrence; mapping them through
+# this pool keeps one object per distinct label, so converted documents hold
+# millions fewer small strings.
+LABEL_POOL = {}
+
 def convert_corexml_sentences_fromnode(sents_x, deptype='collapsed-ccprocessed-dependencies'):
+    """Walks each <sentence>'s children once, and each <token>'s children once,
+    instead of doing a descendant search per field.  This relies on the
+    CoreNLP layout, where tokens, deps and parse are direct children of
+    <sentence>, and word/lemma/etc are direct children of <token>."""
     sents = []
+    intern_label = LABEL_POOL.setdefault
     for sent_x in sents_x:
         sent_infos = {}
-        toks_x = sent_x.findall(".//token")
-
-        sent_infos['tokens'] = [t.findtext(".//word") for t in toks_x]
-        sent_infos['lemmas'] = [t.findtext(".//lemma") for t in toks_x]
-        sent_infos['pos'] = [t.findtext(".//POS") for t in toks_x]
-        sent_infos['ner'] = [t.findtext(".//NER") for t in toks_x]
-
-        char_offsets = []
-        for t in toks_x:
-            start = int(t.findtext('CharacterOffsetBegin'))
-            end = int(t.findtext('CharacterOffsetEnd'))
-            char_offsets.append( (start,end) )
+        toks_x = deps_x = parse_x = None
+        for child in sent_x:
+            tag = child.tag
+            if tag == 'tokens':
+                if toks_x is None: toks_x = child
+            elif tag == deptype:
+                if deps_x is None: deps_x = child
+            elif tag == 'parse':
+                if parse_x is None: parse_x = child
+
+        tokens, lemmas, pos, ner, char_offsets = [],[],[],[],[]
+        for t in (toks_x if toks_x is not None else ()):
+            word = lemma = tpos = tner = start = end = None
+            for x in t:
+                tag = x.tag
+                # same as findtext(): '' for an empty element, None if missing
+                if tag == 'word': word = x.text or ''
+                elif tag == 'lemma': lemma = x.text or ''
+                elif tag == 'POS': tpos = x.text or ''
+                elif tag == 'NER': tner = x.text or ''
+                elif tag == 'CharacterOffsetBegin': start = x.text or ''
+                elif tag == 'CharacterOffsetEnd': end = x.text or ''
+            tokens.append(word)
+            lemmas.append(lemma)
+            pos.append(intern_label(tpos, tpos))
+            ner.append(intern_label(tner, tner))
+            char_offsets.append( (int(start), int(end)) )
+
+        sent_infos['tokens'] = tokens
+        sent_infos['lemmas'] = lemmas
+        sent_infos['pos'] = pos
+        sent_infos['ner'] = ner
         sent_infos['char_offsets'] = char_offsets
 
-        deps_x = sent_x.find('.//' +deptype)
-        #deps_x = sent_x.find('.//collapsed-dependencies')
-        #deps_x = sent_x.find('.//basic-dependencies')
+        #deptype could also be 'collapsed-dependencies' or 'basic-dependencies'
         if deps_x is not None:
             deps_j = []
-            for dep_x in deps_x.findall('.//dep'):
+            for dep_x in deps_x:
+                if dep_x.tag != 'dep': continue
 
                 # the version in Annotated Gigaword looks like
                 # <dep type="nsubj">
@@ -96,17 +122,22 @@ def convert_corexml_sentences_fromnode(sents_x, deptype='collapsed-ccprocessed-d
                 #   <dependent idx="4">up</dependent>
                 # </dep>
 
-                gov = dep_x.find('.//governor')
-                gi = int(gov.get('idx')) - 1 if gov.get('idx') is not None else int(gov.text) -1
-                dept= dep_x.find('.//dependent')
-                di = int(dept.get('idx')) - 1 if dept.get('idx') is not None else int(dept.text) -1
+                gov = dept = None
+                for x in dep_x:
+                    if x.tag == 'governor': gov = x
+                    elif x.tag == 'dependent': dept = x
+                gi = gov.get('idx')
+                gi = int(gi) - 1 if gi is not None else int(gov.text) -1
+                di = dept.get('idx')
+                di = int(di) - 1 if di is not None else int(dept.text) -1
                 # tupl = [dep_x.get('type'), di,gi]  ## my old format was [dep,gov]
-                tupl = [dep_x.get('type'), gi,di]    ## but [gov,dep] seems more standard
+                label = dep_x.get('type')
+                tupl = [intern_label(label, label), gi,di]    ## but [gov,dep] seems more standard
                 deps_j.append(tupl)
             sent_infos['deps'] = deps_j
-        if sent_x.findtext(".//parse") is not None:
+        if parse_x is not None:
             # normalize the sexpr
-            parse = sent_x.findtext(".//parse").strip()
+            parse = (parse_x.text or '').strip()
             parse = re.sub(r'\s+', ' ', parse)
             sent_infos['parse'] = parse
         sents.append(sent_infos)
@@ -115,49 +146,89 @@ def convert_corexml_sentences_fromnode(sents_x, deptype='collapsed-ccprocessed-d
 
 ### Entity coref conversion
 
-class Entity(dict):
+class Mention(object):
+    __slots__ = ('sentence', 'start', 'end', 'head')
+
+    def to_json(self):
+        # same insertion order as the dicts this used to build, so the
+        # JSON comes out byte-identical
+        m = {}
+        m['sentence'] = self.sentence
+        m['start'] = self.start
+        m['end'] = self.end
+        m['head'] = self.head
+        return m
+
+    def sort_key(self):
+        # python2 compares same-size dicts at their smallest differing key,
+        # which for mention dicts means this tuple order
+        return (self.end, self.head, self.sentence, self.start)
+
+class Entity(object):
+    __slots__ = ('mentions', 'first_mention', 'num', 'id')
+
     def __hash__(self):
-        return hash('entity::' + self['id'])
+        return hash('entity::' + self.id)
+
+    def sort_key(self):
+        # the order that sorting the old dict entities gave: by first
+        # mention, ties broken by the mention lists
+        return (self.first_mention, [m.sort_key() for m in self.mentions])
+
+    def to_json(self):
+        ent = {}
+        ent['mentions'] = [m.to_json() for m in self.mentions]
+        ent['first_mention'] = self.first_mention
+        ent['num'] = self.num
+        ent['id'] = self.id
+        return ent
 
 def convert_corexml_coref(doc_etree, sentences):
     coref_x = doc_etree.find('document').find('coreference')
     return convert_corexml_coref_fromnode(coref_x, sentences)
 
 def convert_corexml_coref_fromnode(coreference_node, sentences):
+    """Returns the entities as JSON-ready dicts, sorted by first mention.
+    Walks each <mention>'s children once, like the sentence converter."""
     if coreference_node is None:
         return None
 
     entities = []
-    for entity_x in coreference_node.findall('coreference'):
+    for entity_x in coreference_node:
+        if entity_x.tag != 'coreference': continue
         mentions = []
-        for mention_x in entity_x.findall('mention'):
-            m = {}
-            m['sentence'] = int(mention_x.find('sentence').text) - 1
-            m['start'] = int(mention_x.find('start').text) - 1
-            m['end'] = int(mention_x.find('end').text) - 1
-            m['head'] = int(mention_x.find('head').text) - 1
+        for mention_x in entity_x:
+            if mention_x.tag != 'mention': continue
+            m = Mention()
+            m.sentence = m.start = m.end = m.head = None
+            for x in mention_x:
+                tag = x.tag
+                if tag == 'sentence':
+                    if m.sentence is None: m.sentence = int(x.text) - 1
+                elif tag == 'start':
+                    if m.start is None: m.start = int(x.text) - 1
+                elif tag == 'end':
+                    if m.end is None: m.end = int(x.text) - 1
+                elif tag == 'head':
+                    if m.head is None: m.head = int(x.text) - 1
             mentions.append(m)
         ent = Entity()
-        ent['mentions'] = mentions
-        first_mention = min((m['sentence'],m['head']) for m in mentions)
-        ent['first_mention'] = first_mention
-        # ent['id'] = '%s:%s' % first_mention
+        ent.mentions = mentions
+        ent.first_mention = min((m.sentence, m.head) for m in mentions)
         entities.append(ent)
-    entities.sort()
-    for i in range(len(entities)):
-        ent = entities[i]
-        ent['num'] = i
-        s,pos = ent['first_mention']
-        ent['id'] = "E%s" % i
-        # ent['nice_name'] = sentences[s]['tokens'][pos]['word']
+    entities.sort(key=Entity.sort_key)
+    for i,ent in enumerate(entities):
+        ent.num = i
+        ent.id = "E%s" % i
+        # ent.nice_name = sentences[s]['tokens'][pos]['word']
 
-    return entities
+    return [ent.to_json() for ent in entities]
 
 
 ### Everything below is to input different formats of the corexml
 ### except annotated gigaword
 
-def corexml_inputter():
+def corexml_inputter(read_threads=1, readahead=None):
     """with autodetection"""
     firstline = sys.stdin.readline()
     if '\t' in firstline:
@@ -165,8 +236,10 @@ def corexml_inputter():
         fn = corexmls_from_tsv
     else:
         print>>sys.stderr, "Assuming input is CoreXML filenames"
-        fn = corexmls_from_files
+        fn = lambda lines: corexmls_from_files(lines, read_threads, readahead)
     gen = itertools.chain([firstline], sys.stdin)
+    if convstats.active is not None:
+        gen = convstats.TimedLines(gen, convstats.active)
     gen = (L.rstrip('\n') for L in gen)
     for item in fn(gen):
         yield item
@@ -178,18 +251,59 @@ def smartopen(filename):
     else:
         return open(filename)
 
-def corexmls_from_files(linegen):
-    for doc_i,filename in enumerate(linegen):
-        if doc_i % 100==0: sys.stderr.write('.')
-        data = smartopen(filename).read().decode('utf-8','replace').encode('utf-8')
-        s = filename
-        s = os.path.basename(s)
-        s = re.sub(r'\.gz$', '', s)
-        s = re.sub(r'\.xml$','',s)
-        s = re.sub(r'\.txt$','',s)
-        docid = s
+def read_corexml_file(filename):
+    """(docid, raw bytes) for one file.  The bytes aren't checked as utf8
+    here; see parse_corexml()."""
+    f = smartopen(filename)
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    s = filename
+    s = os.path.basename(s)
+    s = re.sub(r'\.gz$', '', s)
+    s = re.sub(r'\.xml$','',s)
+    s = re.sub(r'\.txt$','',s)
+    docid = s
+    return docid, data
+
+def corexmls_from_files(linegen, read_threads=1, readahead=None):
+    """With read_threads > 1, files are opened, read and gunzipped by a
+    thread pool, up to 'readahead' files (default 4 per thread) ahead of
+    the one being converted, which helps when file latency (e.g. network
+    storage) dominates.  Documents still come out in input order."""
+    if read_threads > 1:
+        docs = prefetch_ordered(read_corexml_file, linegen, read_threads, readahead or 4*read_threads)
+    else:
+        docs = itertools.imap(read_corexml_file, linegen)
+    for doc_i in itertools.count():
+        if doc_i % 100==0 and convstats.active is None: sys.stderr.write('.')
+        convstats.stage_start('read')
+        docid, data = next(docs, (None, None))
+        convstats.stage_end()
+        if docid is None: return
+        convstats.count('bytes_in', len(data))
         yield docid, data
 
+def prefetch_ordered(func, items, threads, readahead):
+    """Like itertools.imap(func, items), with calls run by a thread pool,
+    at most readahead of them in flight at once."""
+    from multiprocessing.pool import ThreadPool
+    from collections import deque
+    pool = ThreadPool(threads)
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= readahead:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(func, (item,)))
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
 def corexmls_from_tsv(linegen):
     for line in linegen:
         parts = line.split('\t')
@@ -200,6 +314,18 @@ def corexmls_from_tsv(linegen):
         data = parts[-1]
         yield docid, data
 
+def parse_corexml(data):
+    """Parse raw XML bytes.  If that fails and the bytes aren't valid utf8,
+    retry with the bad bytes replaced (U+FFFD), which valid input never
+    pays for."""
+    try:
+        return ET.fromstring(data)
+    except ET.ParseError:
+        fixed = data.decode('utf-8','replace').encode('utf-8')
+        if fixed == data:
+            raise
+        return ET.fromstring(fixed)
+
 def convert_corexml_document(xm):
     """ 'xm' is a parsed XML document """
     sentences = convert_corexml_sentences(xm)
@@ -209,26 +335,129 @@ def convert_corexml_document(xm):
 
 ## Outputter routines
 
+# where the outputters write; a bgzf.BlockGzipWriter for --bgzf.
+# each record is written with one write() call, so blocks end on records.
+output = sys.stdout
+# a docindex.IndexWriter, if the output is being indexed
+index_writer = None
+# a labelcodes.LabelCoder, to write POS/NER/dep labels as integer codes
+label_coder = None
+
 def output_sentents_as_jdoc(docid, sentences, entities):
     """One line per document."""
-    print "{docid}\t{shallow_info}\t{full_info}".format(
+    if label_coder is not None:
+        sentences = label_coder.encode_sentences(sentences)
+    line = "{docid}\t{shallow_info}\t{full_info}\n".format(
             docid = docid,
-            shallow_info = mydumps({'sentences': [{'tokens': s['tokens']} for s in sentences]}),
-            full_info = mydumps({'sentences':sentences, 'entities':entities}),
+            shallow_info = jsonio.dumps({'sentences': [{'tokens': s['tokens']} for s in sentences]}),
+            full_info = jsonio.dumps({'sentences':sentences, 'entities':entities}),
     )
+    if index_writer is not None:
+        index_writer.add(docid, len(line))
+    output.write(line)
+
+jcol_writer = None
+def output_sentents_as_jcol(docid, sentences, entities):
+    """Columnar binary version of jdoc; see jcolumnar.py."""
+    global jcol_writer
+    if jcol_writer is None:
+        import jcolumnar
+        jcol_writer = jcolumnar.ColumnarWriter(output)
+    jcol_writer.write(docid, None, sentences, entities)
+
+def jsent_sentence_line(docid, sent_i, sent_info):
+    # built as utf8 bytes: jsonio.dumps() already returns them
+    return "%s\tS%d\t%s\t%s\n" % (docid, sent_i,
+            u' '.join(sent_info['tokens']).encode('utf8'), jsonio.dumps(sent_info))
+
+def jsent_entity_line(docid, ent):
+    return "%s\t%s\t%s\n" % (docid, ent['id'], jsonio.dumps(ent))
+
+# a JsentShardWriter, for jsent with --output-prefix
+jsent_writer = None
 
 def output_sentents_as_jsent(docid, sentences, entities):
-    """One line per sentence.  (And entity.)"""
+    """One line per sentence.  (And entity.)  The index, if any, is keyed by
+    (docid, sentence number); entity lines aren't indexed."""
+    if label_coder is not None:
+        sentences = label_coder.encode_sentences(sentences)
+    if jsent_writer is not None:
+        jsent_writer.write(docid, sentences, entities)
+        return
     for sent_i,sent_info in enumerate(sentences):
-        print u"{docid}\t{sentid}\t{sent_text}\t{sent_info}".format(
-                docid = docid,
-                sentid="S{}".format(sent_i),
-                sent_text = u' '.join(t for t in sent_info['tokens']),
-                sent_info = mydumps(sent_info).decode('utf8')
-            ).encode('utf8')
+        line = jsent_sentence_line(docid, sent_i, sent_info)
+        if index_writer is not None:
+            index_writer.add("%s\t%d" % (docid, sent_i), len(line))
+        output.write(line)
     for ent in entities:
-        print "{docid}\t{entid}\t{ent_info}".format(
-                docid=docid, entid=ent['id'], ent_info=mydumps(ent))
+        line = jsent_entity_line(docid, ent)
+        if index_writer is not None:
+            index_writer.skip(len(line))
+        output.write(line)
+
+class JsentShardWriter(object):
+    """jsent with sentences and entities in separate files, each split over
+    nshards files by a hash of the docid (docindex.shard_of), so a
+    document's sentences and entities are all in the same shard number:
+        PREFIX.jsent  PREFIX.jents                  (one shard)
+        PREFIX.000.jsent  PREFIX.000.jents  ...     (several)
+    With index, each PREFIX[.NNN].jsent gets a (docid, sentence number)
+    index; with compress, the files are block-gzip (.jsent.gz etc.)."""
+    def __init__(self, prefix, nshards=1, index=False, compress=False):
+        import docindex, bgzf
+        self.nshards = nshards
+        self.shard_of = docindex.shard_of
+        gz = '.gz' if compress else ''
+        self.sents, self.ents, self.indexes = [], [], []
+        for i in range(nshards):
+            files = []
+            paths = [docindex.shard_path(prefix, i, nshards, suffix + gz) for suffix in ['.jsent', '.jents']]
+            for path in paths:
+                f = open(path, 'wb', jsonio.OUTPUT_BUFSIZE)
+                if compress:
+                    f = bgzf.BlockGzipWriter(f)
+                if convstats.active is not None:
+                    f = convstats.TimedWriter(f, convstats.active)
+                files.append(f)
+            self.sents.append(files[0])
+            self.ents.append(files[1])
+            if index:
+                self.indexes.append(docindex.open_index_writer(paths[0],
+                        tell=files[0].tell_virtual if compress else None))
+        if label_coder is not None:
+            header = label_coder.header_line()
+            for i,f in enumerate(self.sents):
+                f.write(header)
+                if index and not compress:
+                    self.indexes[i].skip(len(header))
+
+    def write(self, docid, sentences, entities):
+        shard = self.shard_of(docid, self.nshards) if self.nshards > 1 else 0
+        out = self.sents[shard]
+        index = self.indexes[shard] if self.indexes else None
+        for sent_i,sent_info in enumerate(sentences):
+            line = jsent_sentence_line(docid, sent_i, sent_info)
+            if index is not None:
+                index.add("%s\t%d" % (docid, sent_i), len(line))
+            out.write(line)
+        out = self.ents[shard]
+        for ent in entities:
+            out.write(jsent_entity_line(docid, ent))
+
+    def close(self):
+        for f in self.sents + self.ents:
+            f.close()
+        for w in self.indexes:
+            w.close()
+
+def output_sentents_as_jfields(docid, sentences, entities):
+    """Like jdoc, with each field in its own column; see jfields.py.  There
+    is no ShallowInfo: the Meta column is null."""
+    import jfields
+    line = jfields.render_fields(docid, 'null', {'sentences':sentences, 'entities':entities}) + '\n'
+    if index_writer is not None:
+        index_writer.add(docid, len(line))
+    output.write(line)
 
 def do_output(output_format, docid, sentences, entities):
     outputter = eval('output_sentents_as_' + output_format)
@@ -237,34 +466,122 @@ def do_output(output_format, docid, sentences, entities):
 def corexml_mainloop(args):
     Ndoc, Nsent, Nent = 0,0,0
 
-    for docid,data in corexml_inputter():
+    for docid,data in corexml_inputter(args.read_threads, args.readahead):
+        convstats.stage_start('parse')
         try:
-            doc_etree = ET.fromstring(data)
+            doc_etree = parse_corexml(data)
         except ET.ParseError:
+            convstats.stage_end()
+            convstats.count('parse_errors')
             print>>sys.stderr, "XML parse failed on doc: ",docid
             continue
+        convstats.stage_end()
 
-        sentences, entities = convert_corexml_document(doc_etree)
+        # same as convert_corexml_document(), with the steps timed
+        convstats.stage_start('sentences')
+        sentences = convert_corexml_sentences(doc_etree)
+        convstats.stage_end()
+        convstats.stage_start('coref')
+        entities = convert_corexml_coref(doc_etree, sentences)
+        convstats.stage_end()
 
         # for sent in sentences: sent['docid'] = docid
         # for ent in entities: ent['docid'] = docid
 
+        # the outputters serialize and write; writes are timed separately
+        convstats.stage_start('serialize')
         do_output(args.output_format, docid, sentences, entities)
+        convstats.stage_end()
 
         Ndoc += 1
         Nsent += len(sentences)
         Nent += len(entities)
+        if convstats.active is not None:
+            convstats.count('docs')
+            convstats.count('sentences', len(sentences))
+            convstats.count('entities', len(entities))
+            convstats.active.maybe_report()
     print>>sys.stderr, "\nProcessed {} documents, {} sentences, {} entities".format(Ndoc, Nsent, Nent)
 
 #################################################
 
 if __name__=='__main__':
     import argparse; p=argparse.ArgumentParser()
-    p.add_argument('output_format', choices=['jdoc','jsent','shallow'], default='jdoc')
+    p.add_argument('output_format', choices=['jdoc','jsent','jcol','jfields','shallow'], default='jdoc')
+    p.add_argument('--index', metavar='FILE', nargs='?', const='',
+            help="write a docid index (jdoc, jfields) or (docid, sentence number) index (jsent) to FILE "
+                 "(see docindex.py), assuming stdout goes to a new file.  With --output-prefix, no FILE.")
+    p.add_argument('--output-prefix',
+            help="jsent: write sentences to PREFIX.jsent and entities to PREFIX.jents instead of stdout")
+    p.add_argument('--shards', type=int, default=1,
+            help="with --output-prefix, split the output over this many files by docid hash")
+    p.add_argument('--bgzf', action='store_true',
+            help="write seekable block-gzip output (see bgzf.py)")
+    p.add_argument('--read-threads', type=int, default=1,
+            help="for filename input: read (and gunzip) files with this many threads, ahead of conversion")
+    p.add_argument('--readahead', type=int,
+            help="with --read-threads, at most this many files read ahead (default 4 per thread)")
+    p.add_argument('--stats', action='store_true',
+            help="report throughput and per-stage timings on stderr")
+    p.add_argument('--stats-file',
+            help="with --stats, append the JSON summary to this file (default: stderr)")
+    p.add_argument('--label-codes', action='store_true',
+            help="jdoc/jsent: write POS/NER/dep labels as integer codes, with a header line (see labelcodes.py)")
+    p.add_argument('--json-backend',
+            help="JSON encoder: " + ', '.join(sorted(jsonio.BACKENDS)) + " (default: ujson if installed, else json; see jsonio.py)")
     args = p.parse_args()
+    if args.label_codes and args.output_format not in ('jdoc','jsent'):
+        p.error("--label-codes is for jdoc and jsent")
+    if args.output_prefix and args.output_format != 'jsent':
+        p.error("--output-prefix is for jsent")
+    if args.shards != 1 and not args.output_prefix:
+        p.error("--shards needs --output-prefix")
+    if args.index == '' and not args.output_prefix:
+        p.error("--index needs a FILE")
+    if args.index is not None and args.output_format not in ('jdoc','jsent','jfields'):
+        p.error("--index is for jdoc, jsent and jfields")
+    if args.json_backend:
+        try:
+            jsonio.set_backend(args.json_backend)
+        except (ValueError, ImportError) as e:
+            p.error("--json-backend: %s" % e)
+    elif jsonio.env_error:
+        p.error(jsonio.env_error)
+    if args.stats:
+        convstats.active = convstats.Stats(label=args.output_prefix)
+    if args.label_codes:
+        import labelcodes
+        label_coder = labelcodes.LabelCoder()
+    if args.output_prefix:
+        jsent_writer = JsentShardWriter(args.output_prefix, args.shards,
+                index=args.index is not None, compress=args.bgzf)
+    else:
+        if args.bgzf:
+            import bgzf
+            output = bgzf.BlockGzipWriter(sys.stdout)
+        if args.stats:
+            output = convstats.TimedWriter(output, convstats.active)
+        if args.index:
+            import docindex
+            index_writer = docindex.IndexWriter(open(args.index, 'w'),
+                    tell=output.tell_virtual if args.bgzf else None)
+        if label_coder is not None:
+            header = label_coder.header_line()
+            output.write(header)
+            if index_writer is not None and not args.bgzf:
+                index_writer.skip(len(header))
     # if args.input_format=='corexml':
     if True:
         corexml_mainloop(args)
+    if jsent_writer is not None:
+        jsent_writer.close()
+    if args.bgzf and jsent_writer is None:
+        output.finish()
+    output.flush()
+    if convstats.active is not None:
+        convstats.active.write_summary(open(args.stats_file, 'a') if args.stats_file else None)
+    if index_writer is not None:
+        index_writer.close()
 
 
 
@@ -0,0 +1,472 @@
+"""
+Corpus-level NumPy arrays over converted documents, for counting and
+filtering across a whole corpus without walking per-sentence Python lists.
+Needs numpy.
+
+A CorpusArrays holds, for all documents at once:
+    tokens, lemmas      int32 ids into vocabs['words']
+    pos, ner            int32 ids into vocabs['pos'], vocabs['ner']
+    char_start,char_end int32, per token
+    dep_label           int32 ids into vocabs['deplabels'], per dependency
+    dep_gov, dep_dep    int32 token positions within the sentence, 0-based,
+                        with gov -1 for the root (same as in jdoc)
+and the offset arrays that carve them up:
+    doc_sent_start      sentences of document d are doc_sent_start[d]:doc_sent_start[d+1]
+    sent_tok_start      tokens of sentence s are sent_tok_start[s]:sent_tok_start[s+1]
+    sent_dep_start      deps of sentence s, likewise
+Id 0 in every vocab is None (e.g. a token with no <word>).
+
+Built from jdoc or justsent lines (or directly from the 'sentences' lists
+that core2json's converters return), and saved to / loaded from .npz, since
+building means JSON-decoding everything once.
+
+Or saved as a store: a directory of .npy files, one per array, plus the
+string tables packed as utf8 bytes with offset arrays.  open_store()
+memory-maps all of them, so it returns at once whatever the corpus size,
+strings are only decoded when looked up, and any number of processes on a
+machine share one page-cached copy instead of each holding its own.
+document() rebuilds a document's sentences from array slices, with no
+parsing.
+
+Commandline:
+  python corpusarrays.py build x.npz gw/data/nyt_eng_199407.jdoc [more.jdoc ...]
+  python corpusarrays.py count x.npz pos 3       # top POS trigrams
+  python corpusarrays.py count x.npz dep_label
+  python corpusarrays.py nerspans x.npz
+  python corpusarrays.py store nyt_199407.castore gw/data/nyt_eng_199407.jdoc
+  python corpusarrays.py get nyt_199407.castore < docids.txt
+count and nerspans also take a store directory.
+"""
+import sys,os,json,shutil
+import jsonio
+import labelcodes
+from array import array
+import numpy as np
+
+# token columns and the vocab each is coded against
+TOKEN_FIELDS = [('tokens','words'), ('lemmas','words'), ('pos','pos'), ('ner','ner')]
+VOCAB_FOR = dict(TOKEN_FIELDS + [('dep_label','deplabels')])
+VOCAB_NAMES = ['words','pos','ner','deplabels']
+COLUMNS = ['tokens','lemmas','pos','ner','char_start','char_end','dep_label','dep_gov','dep_dep']
+OFFSETS = ['doc_sent_start','sent_tok_start','sent_dep_start']
+
+class Vocab(object):
+    def __init__(self, strs=None):
+        self.strs = [None]
+        self.ids = {None: 0}
+        for s in (strs or [])[1:]:
+            self.code(s)
+    def code(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strs)
+            self.strs.append(s)
+        return i
+    def __len__(self):
+        return len(self.strs)
+
+class CorpusBuilder(object):
+    """Accumulates documents in compact arrays; finish() gives the CorpusArrays."""
+    def __init__(self):
+        self.vocabs = dict((name, Vocab()) for name in VOCAB_NAMES)
+        self.docids = []
+        self.cols = dict((name, array('i')) for name in COLUMNS)
+        self.offsets = dict((name, array('l', [0])) for name in OFFSETS)
+
+    def add_document(self, docid, sentences):
+        """sentences as in jdoc: dicts with tokens, lemmas, pos, ner,
+        char_offsets and optionally deps.  Fields other than tokens may be
+        missing (as in justsent): they get id 0 (None), and offsets -1."""
+        cols = self.cols
+        for sent in sentences:
+            n = len(sent['tokens'])
+            for field, vocab_name in TOKEN_FIELDS:
+                if field in sent:
+                    code = self.vocabs[vocab_name].code
+                    cols[field].extend([code(s) for s in sent[field]])
+                else:
+                    cols[field].extend([0] * n)
+            if 'char_offsets' in sent:
+                for s,e in sent['char_offsets']:
+                    cols['char_start'].append(s)
+                    cols['char_end'].append(e)
+            else:
+                cols['char_start'].extend([-1] * n)
+                cols['char_end'].extend([-1] * n)
+            code = self.vocabs['deplabels'].code
+            for label, gov, dep in sent.get('deps') or ():
+                cols['dep_label'].append(code(label))
+                cols['dep_gov'].append(gov)
+                cols['dep_dep'].append(dep)
+            self.offsets['sent_tok_start'].append(len(cols['tokens']))
+            self.offsets['sent_dep_start'].append(len(cols['dep_label']))
+        self.docids.append(docid)
+        self.offsets['doc_sent_start'].append(len(self.offsets['sent_tok_start']) - 1)
+
+    def add_jdoc_line(self, line, vocabs=None):
+        """A jdoc line (payload is {'sentences':..., 'entities':...}) or a
+        justsent line (payload is the sentence list).  vocabs: from the
+        file's '#labelcodes' header, if its labels are coded."""
+        docid, meta, payload = line.rstrip('\n').split('\t')
+        payload = jsonio.loads(payload)
+        if vocabs is not None:
+            labelcodes.decode_info(payload, vocabs)
+        if isinstance(payload, dict):
+            payload = payload['sentences']
+        self.add_document(docid, payload)
+
+    def finish(self):
+        arrays = {}
+        for name in COLUMNS:
+            arrays[name] = np.frombuffer(self.cols[name], dtype=np.intc).astype(np.int32)
+        for name in OFFSETS:
+            arrays[name] = np.frombuffer(self.offsets[name], dtype=np.int_).astype(np.int64)
+        vocabs = dict((name, v.strs) for name,v in self.vocabs.items())
+        return CorpusArrays(self.docids, vocabs, arrays)
+
+class CorpusArrays(object):
+    def __init__(self, docids, vocabs, arrays):
+        self.docids = docids
+        self.vocabs = vocabs
+        for name in COLUMNS + OFFSETS:
+            setattr(self, name, arrays[name])
+        self._token_sent = self._dep_sent = None
+        self._vocab_ids = {}
+        self._docid_index = None
+
+    def __len__(self):
+        return len(self.docids)
+
+    @property
+    def num_sentences(self):
+        return len(self.sent_tok_start) - 1
+
+    @property
+    def token_sent(self):
+        """Sentence index of each token"""
+        if self._token_sent is None:
+            self._token_sent = np.repeat(np.arange(self.num_sentences), np.diff(self.sent_tok_start))
+        return self._token_sent
+
+    @property
+    def dep_sent(self):
+        """Sentence index of each dependency"""
+        if self._dep_sent is None:
+            self._dep_sent = np.repeat(np.arange(self.num_sentences), np.diff(self.sent_dep_start))
+        return self._dep_sent
+
+    @property
+    def sent_doc(self):
+        return np.repeat(np.arange(len(self.docids)), np.diff(self.doc_sent_start))
+
+    @property
+    def token_doc(self):
+        return self.sent_doc[self.token_sent]
+
+    ## Vocab lookups
+
+    def vocab(self, field):
+        return self.vocabs[VOCAB_FOR[field]]
+
+    def vocab_id(self, field, s):
+        """Id of string s in field's vocab, or -1 if it never occurs"""
+        name = VOCAB_FOR[field]
+        if name not in self._vocab_ids:
+            self._vocab_ids[name] = dict((x,i) for i,x in enumerate(self.vocabs[name]))
+        return self._vocab_ids[name].get(s, -1)
+
+    ## Documents
+
+    def doc_index(self, docid):
+        """Document number of docid, or -1"""
+        if self._docid_index is None:
+            docids = np.array(self.docids, dtype='S')
+            order = np.argsort(docids, kind='mergesort')
+            self._docid_index = docids[order], order
+        sorted_ids, order = self._docid_index
+        i = np.searchsorted(sorted_ids, docid)
+        if i < len(sorted_ids) and sorted_ids[i] == docid:
+            return int(order[i])
+        return -1
+
+    def document(self, d):
+        """Sentences of document number d, as jdoc-style dicts (with 'deps'
+        always present)"""
+        sents = []
+        for si in xrange(self.doc_sent_start[d], self.doc_sent_start[d+1]):
+            t0, t1 = self.sent_tok_start[si], self.sent_tok_start[si+1]
+            sent = {}
+            for field,vocab_name in TOKEN_FIELDS:
+                strs = self.vocabs[vocab_name]
+                sent[field] = [strs[i] for i in getattr(self, field)[t0:t1].tolist()]
+            sent['char_offsets'] = zip(self.char_start[t0:t1].tolist(), self.char_end[t0:t1].tolist())
+            d0, d1 = self.sent_dep_start[si], self.sent_dep_start[si+1]
+            labels = self.vocabs['deplabels']
+            sent['deps'] = [[labels[l], g, x] for l,g,x in zip(self.dep_label[d0:d1].tolist(),
+                                self.dep_gov[d0:d1].tolist(), self.dep_dep[d0:d1].tolist())]
+            sents.append(sent)
+        return sents
+
+    ## Filtering
+
+    def where(self, field, values):
+        """Boolean mask over tokens (or deps, for dep_label) whose field is
+        the string values, or one of the list of strings values."""
+        if isinstance(values, basestring) or values is None:
+            values = [values]
+        ids = [self.vocab_id(field, v) for v in values]
+        return np.in1d(getattr(self, field), [i for i in ids if i >= 0])
+
+    def sentences_with(self, token_mask):
+        """Indices of sentences with at least one token in the mask"""
+        return np.unique(self.token_sent[token_mask])
+
+    def docs_with(self, token_mask):
+        """Indices of documents with at least one token in the mask"""
+        return np.unique(self.sent_doc[self.sentences_with(token_mask)])
+
+    def docs_mask(self, doc_indices):
+        """Boolean mask over tokens, true for the tokens of the given documents"""
+        return np.in1d(self.token_doc, doc_indices)
+
+    def dep_gov_positions(self):
+        """Corpus-level token position of each dependency's governor (-1
+        for the root) and dependent."""
+        base = self.sent_tok_start[self.dep_sent]
+        gov = np.where(self.dep_gov >= 0, base + self.dep_gov, -1)
+        return gov, base + self.dep_dep
+
+    ## Counting
+
+    def counts(self, field, mask=None, top=None):
+        """[(string, count)] by descending count, over tokens (or deps, for
+        dep_label) in the mask."""
+        ids = getattr(self, field)
+        if mask is not None:
+            ids = ids[mask]
+        c = np.bincount(ids, minlength=len(self.vocab(field)))
+        order = np.argsort(-c, kind='mergesort')
+        order = order[c[order] > 0][:top]
+        strs = self.vocab(field)
+        return [(strs[i], int(c[i])) for i in order]
+
+    def ngram_counts(self, field, n, mask=None, top=None):
+        """[(tuple of strings, count)] by descending count, for n-grams of
+        field within sentences.  With a token mask, only n-grams whose
+        tokens are all in it."""
+        ids = getattr(self, field).astype(np.int64)
+        V = len(self.vocab(field))
+        if float(V) ** n >= 2**63:
+            raise ValueError("vocab of %d is too big for %d-grams" % (V, n))
+        m = len(ids) - n + 1
+        if m <= 0: return []
+        # each n-gram as one mixed-radix integer
+        code = ids[:m].copy()
+        for k in range(1, n):
+            code = code * V + ids[k:m+k]
+        sents = self.token_sent
+        ok = sents[:m] == sents[n-1:]
+        if mask is not None:
+            for k in range(n):
+                ok &= mask[k:m+k]
+        uniq, c = np.unique(code[ok], return_counts=True)
+        order = np.argsort(-c, kind='mergesort')[:top]
+        strs = self.vocab(field)
+        result = []
+        for i in order:
+            x, gram = int(uniq[i]), []
+            for k in range(n):
+                x, r = divmod(x, V)
+                gram.append(strs[r])
+            result.append((tuple(reversed(gram)), int(c[i])))
+        return result
+
+    def ner_spans(self, outside=('O',)):
+        """Maximal runs of the same NER tag within a sentence.  Returns
+        arrays (start, end, ner id), with corpus-level token positions,
+        end exclusive."""
+        ner = self.ner
+        if len(ner) == 0:
+            return (np.zeros(0, np.int64),) * 2 + (np.zeros(0, np.int32),)
+        inside = ~self.where('ner', list(outside) + [None])
+        sents = self.token_sent
+        newrun = np.ones(len(ner), bool)
+        newrun[1:] = (ner[1:] != ner[:-1]) | (sents[1:] != sents[:-1])
+        starts = np.flatnonzero(inside & newrun)
+        endrun = np.ones(len(ner), bool)
+        endrun[:-1] = newrun[1:]
+        ends = np.flatnonzero(inside & endrun) + 1
+        return starts, ends, ner[starts]
+
+    def ner_span_counts(self, field='tokens', top=None):
+        """[((ner type, text), count)] by descending count"""
+        starts, ends, types = self.ner_spans()
+        words = self.vocab(field)
+        nerv = self.vocabs['ner']
+        ids = getattr(self, field)
+        c = {}
+        for s,e,t in zip(starts.tolist(), ends.tolist(), types.tolist()):
+            key = (nerv[t], u' '.join(words[i] or u'' for i in ids[s:e]))
+            c[key] = c.get(key, 0) + 1
+        return sorted(c.items(), key=lambda x: -x[1])[:top]
+
+    ## Saving
+
+    def save(self, path):
+        arrays = dict((name, getattr(self, name)) for name in COLUMNS + OFFSETS)
+        # strings as JSON, so loading doesn't need pickle
+        arrays['docids'] = np.array(json.dumps(list(self.docids)))
+        arrays['vocabs'] = np.array(json.dumps(self.vocabs))
+        np.savez(path, **arrays)
+
+    def save_store(self, path):
+        """Write the store directory; see open_store()"""
+        tmp = path + '.tmp'
+        if os.path.exists(tmp): shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        def save(name, a):
+            np.save(os.path.join(tmp, name + '.npy'), a)
+        for name in COLUMNS + OFFSETS:
+            save(name, getattr(self, name))
+        docids = np.array(list(self.docids), dtype='S')
+        order = np.argsort(docids, kind='mergesort')
+        save('docids', docids)
+        save('docids_sorted', docids[order])
+        save('docids_order', order)
+        for name in VOCAB_NAMES:
+            blob, offsets = pack_strings(self.vocabs[name])
+            save('vocab_' + name, blob)
+            save('vocab_%s_offsets' % name, offsets)
+        info = {'version': STORE_VERSION, 'docs': len(self.docids),
+                'sentences': self.num_sentences, 'tokens': len(self.tokens)}
+        json.dump(info, open(os.path.join(tmp, STORE_INFO), 'w'))
+        if os.path.exists(path): shutil.rmtree(path)
+        os.rename(tmp, path)
+
+## Stores
+
+STORE_VERSION = 1
+STORE_INFO = 'store.json'
+
+def to_utf8(s):
+    return s.encode('utf8') if isinstance(s, unicode) else str(s)
+
+def pack_strings(strs):
+    """(utf8 bytes as a uint8 array, int64 offsets).  None packs as empty."""
+    encoded = ['' if s is None else to_utf8(s) for s in strs]
+    offsets = np.zeros(len(encoded) + 1, np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.array(bytearray(''.join(encoded)), np.uint8), offsets
+
+class StringTable(object):
+    """A vocab packed by pack_strings().  Id 0 is None; others are decoded
+    on each access."""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+    def __len__(self):
+        return len(self.offsets) - 1
+    def __getitem__(self, i):
+        if i == 0: return None
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tostring().decode('utf8')
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+def open_store(path):
+    """A CorpusArrays over a store directory, with every array memory-mapped
+    read-only."""
+    info = json.load(open(os.path.join(path, STORE_INFO)))
+    if info['version'] != STORE_VERSION:
+        raise ValueError("%s: store version %s, expected %s" % (path, info['version'], STORE_VERSION))
+    def mmap(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    arrays = dict((name, mmap(name)) for name in COLUMNS + OFFSETS)
+    vocabs = dict((name, StringTable(mmap('vocab_' + name), mmap('vocab_%s_offsets' % name)))
+                  for name in VOCAB_NAMES)
+    c = CorpusArrays(mmap('docids'), vocabs, arrays)
+    c._docid_index = mmap('docids_sorted'), mmap('docids_order')
+    return c
+
+def load(path):
+    z = np.load(path)
+    arrays = dict((name, z[name]) for name in COLUMNS + OFFSETS)
+    return CorpusArrays(json.loads(str(z['docids'])), json.loads(str(z['vocabs'])), arrays)
+
+def from_jdoc_files(filenames):
+    b = CorpusBuilder()
+    for filename in filenames:
+        vocabs = None
+        for line in open(filename):
+            if line.startswith('#'):
+                vocabs = labelcodes.parse_header(line) or vocabs
+                continue
+            b.add_jdoc_line(line, vocabs)
+    return b.finish()
+
+##########################################
+
+def open_any(path):
+    return open_store(path) if os.path.isdir(path) else load(path)
+
+def run_build(npzfile, jdocfiles):
+    "Build arrays from jdoc or justsent files and save them"
+    from_jdoc_files(jdocfiles).save(npzfile)
+
+def run_count(npzfile, field, n=1, top=50):
+    "Top n-grams of a field (tokens, lemmas, pos, ner, dep_label)"
+    c = open_any(npzfile)
+    result = c.counts(field, top=top) if n == 1 else c.ngram_counts(field, n, top=top)
+    for x,count in result:
+        if n > 1: x = u' '.join(s or u'' for s in x)
+        print "%d\t%s" % (count, to_utf8(x))
+
+def run_nerspans(npzfile, top=50):
+    "Top NER spans"
+    for (t,text),count in open_any(npzfile).ner_span_counts(top=top):
+        print "%d\t%s\t%s" % (count, to_utf8(t), to_utf8(text))
+
+def run_store(storedir, jdocfiles):
+    "Build a memory-mappable store from jdoc or justsent files"
+    from_jdoc_files(jdocfiles).save_store(storedir)
+
+def run_get(storedir):
+    "Docids on stdin; print docid and sentences JSON from the store"
+    c = open_any(storedir)
+    for line in sys.stdin:
+        docid = line.strip()
+        d = c.doc_index(docid)
+        if d < 0:
+            print>>sys.stderr, "not found: %r" % docid
+            continue
+        print "%s\t%s" % (docid, json.dumps(c.document(d)))
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Corpus-level NumPy arrays")
+    sub = p.add_subparsers()
+    c = sub.add_parser('build', help=run_build.__doc__)
+    c.add_argument('npzfile')
+    c.add_argument('jdocfiles', nargs='+')
+    c.set_defaults(func=run_build)
+    c = sub.add_parser('count', help=run_count.__doc__)
+    c.add_argument('npzfile', help=".npz file or store directory")
+    c.add_argument('field')
+    c.add_argument('n', nargs='?', type=int, default=1)
+    c.add_argument('top', nargs='?', type=int, default=50)
+    c.set_defaults(func=run_count)
+    c = sub.add_parser('nerspans', help=run_nerspans.__doc__)
+    c.add_argument('npzfile', help=".npz file or store directory")
+    c.add_argument('top', nargs='?', type=int, default=50)
+    c.set_defaults(func=run_nerspans)
+    c = sub.add_parser('store', help=run_store.__doc__)
+    c.add_argument('storedir')
+    c.add_argument('jdocfiles', nargs='+')
+    c.set_defaults(func=run_store)
+    c = sub.add_parser('get', help=run_get.__doc__)
+    c.add_argument('storedir')
+    c.set_defaults(func=run_get)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
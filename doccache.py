@@ -0,0 +1,176 @@
+"""
+On-disk cache of converted documents, keyed by content, so reconverting
+documents that were already converted (by an earlier run, or a run over an
+overlapping set of files) skips parsing and conversion.
+
+The key is the SHA-1 of the converter's options string (which includes a
+version number, bumped whenever output changes) and the raw <DOC> XML
+string.  Entries are sharded by the first two hex digits:
+    DIR/ab/cdef0123...
+Each entry is a zlib-compressed list of rendered formats,
+    fmt \\t length \\n text
+repeated, so a document converted for one --emit set can be reused for
+another one that needs a subset of the formats.  A hit refreshes the
+entry's mtime; evict() removes the least recently used entries until the
+cache is under a size limit.  Entries are written to a temp file, synced
+and renamed, so several processes can share one cache; an entry that's
+unreadable anyway (truncated, garbled) counts as a miss and is removed.
+
+Commandline:
+  python doccache.py stats ~/.cache/gigaword
+  python doccache.py evict ~/.cache/gigaword 2000    # down to 2000 MB
+  python doccache.py clear ~/.cache/gigaword
+"""
+import sys,os,hashlib,zlib,shutil
+
+class DocCache(object):
+    def __init__(self, path, options=''):
+        self.path = path
+        self.options = options
+        self.hits = self.misses = 0
+
+    def key(self, docstr):
+        return hashlib.sha1(self.options + '\0' + docstr).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _read(self, path):
+        try:
+            data = open(path, 'rb').read()
+        except IOError:
+            return None
+        try:
+            return unpack_entry(zlib.decompress(data))
+        except (zlib.error, ValueError):
+            # truncated or garbled (e.g. left empty by a crash): a miss
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def get(self, docstr, formats):
+        """{format: text} for the formats, or None unless all are cached"""
+        path = self.entry_path(self.key(docstr))
+        entry = self._read(path)
+        if entry is None or not all(f in entry for f in formats):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return dict((f, entry[f]) for f in formats)
+
+    def put(self, docstr, rendered):
+        """Adds the formats in rendered to the document's entry"""
+        path = self.entry_path(self.key(docstr))
+        entry = self._read(path) or {}
+        entry.update(rendered)
+        d = os.path.dirname(path)
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:
+                # another process made it
+                if not os.path.isdir(d): raise
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(pack_entry(entry), 1))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+
+def pack_entry(entry):
+    parts = []
+    for fmt,text in sorted(entry.items()):
+        if isinstance(text, unicode):
+            text = text.encode('utf8')
+        parts.append("%s\t%d\n" % (fmt, len(text)))
+        parts.append(text)
+    return ''.join(parts)
+
+def unpack_entry(data):
+    entry = {}
+    pos = 0
+    while pos < len(data):
+        nl = data.index('\n', pos)
+        fmt, n = data[pos:nl].split('\t')
+        pos = nl + 1 + int(n)
+        entry[fmt] = data[nl+1:pos]
+    return entry
+
+## Maintenance
+
+def iter_entries(path):
+    """Yields (mtime, size, filename) for every entry"""
+    for shard in os.listdir(path):
+        d = os.path.join(path, shard)
+        if not os.path.isdir(d): continue
+        for name in os.listdir(d):
+            fn = os.path.join(d, name)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, fn
+
+def evict(path, max_bytes, low_water=0.9):
+    """If the cache is over max_bytes, removes least recently used entries
+    until it's under low_water * max_bytes.  Returns (entries removed,
+    bytes removed)."""
+    if not os.path.isdir(path):
+        return 0, 0
+    entries = list(iter_entries(path))
+    total = sum(size for mtime,size,fn in entries)
+    if total <= max_bytes:
+        return 0, 0
+    entries.sort()
+    target = low_water * max_bytes
+    n = nbytes = 0
+    for mtime,size,fn in entries:
+        if total - nbytes <= target: break
+        try:
+            os.remove(fn)
+        except OSError:
+            continue
+        n += 1
+        nbytes += size
+    return n, nbytes
+
+##########################################
+
+def run_stats(path):
+    "Number of entries and total size"
+    entries = list(iter_entries(path))
+    print "%d entries, %.1f MB" % (len(entries), sum(e[1] for e in entries)/1e6)
+
+def run_evict(path, max_mb):
+    "Remove least recently used entries until under max_mb"
+    n, nbytes = evict(path, max_mb * 1e6)
+    print "removed %d entries, %.1f MB" % (n, nbytes/1e6)
+
+def run_clear(path):
+    "Remove the whole cache"
+    shutil.rmtree(path)
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Converted-document cache maintenance")
+    sub = p.add_subparsers()
+    c = sub.add_parser('stats', help=run_stats.__doc__)
+    c.add_argument('path')
+    c.set_defaults(func=run_stats)
+    c = sub.add_parser('evict', help=run_evict.__doc__)
+    c.add_argument('path')
+    c.add_argument('max_mb', type=float)
+    c.set_defaults(func=run_evict)
+    c = sub.add_parser('clear', help=run_clear.__doc__)
+    c.add_argument('path')
+    c.set_defaults(func=run_clear)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Sidecar docid indexes for the one-line-per-document formats (jdoc, justsent,
+meta), for random access by document ID.
+
+The index for X.jdoc is X.jdoc.idx, one line per document:
+    DocID \t ByteOffset \t Length
+where Length includes the trailing newline.  For block-gzip files (X.jdoc.gz,
+see bgzf.py) ByteOffset is a bgzf virtual offset, and Length is uncompressed.
+
+jsent files (one line per sentence, from core2json.py) get a sentence index
+instead, keyed by document and sentence number:
+    DocID \t SentNum \t ByteOffset \t Length
+
+AGW document IDs encode the source and month, e.g. NYT_ENG_19940701.0001 is
+in nyt_eng_199407, so a lookup only opens the one file it needs.
+
+Commandline:
+  # index an existing file
+  python docindex.py build gw/data/nyt_eng_199407.jdoc
+  # docids on stdin, their records on stdout
+  python docindex.py lookup gw/data .jdoc < docids.txt
+  python docindex.py lookup gw/data .jdoc.gz < docids.txt
+  # "docid \t sentnum" lines on stdin; sentences from core2json.py's
+  # 'jsent --output-prefix out/x --shards 16 --index' output
+  python docindex.py sentences out/x 16 < sentids.txt
+"""
+import sys,os,re,zlib
+from collections import defaultdict
+import bgzf
+
+INDEX_SUFFIX = '.idx'
+
+class IndexWriter(object):
+    """Records where each document lands as an output file is written
+    sequentially.  Call add() for every indexed record, just before writing
+    it, and skip() for any other bytes written to the same file.  For
+    block-gzip output, pass tell=writer.tell_virtual, and offsets are bgzf
+    virtual offsets instead."""
+    def __init__(self, f, offset=0, tell=None):
+        self.f = f
+        self.offset = offset
+        self.tell = tell
+    def add(self, docid, nbytes):
+        if self.tell is not None:
+            self.offset = self.tell()
+        self.f.write("%s\t%d\t%d\n" % (docid, self.offset, nbytes))
+        self.offset += nbytes
+    def skip(self, nbytes):
+        self.offset += nbytes
+    def close(self):
+        self.f.close()
+
+def index_path(datafile):
+    return datafile + INDEX_SUFFIX
+
+def open_index_writer(datafile, tell=None):
+    return IndexWriter(open(index_path(datafile), 'w'), tell=tell)
+
+def load_index(path):
+    """Returns {docid: (offset, length)}"""
+    index = {}
+    for line in open(path):
+        docid, offset, length = line.rstrip('\n').split('\t')
+        index[docid] = (int(offset), int(length))
+    return index
+
+def load_sentence_index(path):
+    """Returns {(docid, sentnum): (offset, length)}"""
+    index = {}
+    for line in open(path):
+        docid, sentnum, offset, length = line.rstrip('\n').split('\t')
+        index[docid, int(sentnum)] = (int(offset), int(length))
+    return index
+
+def build_index(datafile):
+    """Index a file that was written without one."""
+    w = open_index_writer(datafile)
+    if datafile.endswith('.gz'):
+        f = open(datafile, 'rb')
+        for coffset, member in bgzf.iter_members(f):
+            uoffset = 0
+            for line in bgzf.decompress_member(member).split('\n')[:-1]:
+                w.offset = bgzf.make_voffset(coffset, uoffset)
+                if not line.startswith('#'):
+                    w.add(line.split('\t', 1)[0], len(line)+1)
+                uoffset += len(line)+1
+    else:
+        for line in open(datafile):
+            if line.startswith('#'):
+                # a header line, e.g. from --label-codes
+                w.skip(len(line))
+                continue
+            w.add(line.split('\t', 1)[0], len(line))
+    w.close()
+
+## Routing docids to files
+
+def docid_to_basename(docid):
+    """NYT_ENG_19940701.0001 -> nyt_eng_199407"""
+    m = re.search(r'^(.*)_(\d\d\d\d\d\d)\d\d\.', docid)
+    if not m:
+        raise ValueError("can't get source and month from docid %r" % docid)
+    return "%s_%s" % (m.group(1).lower(), m.group(2))
+
+def shard_of(docid, nshards):
+    """Which of nshards files a document goes in.  crc32, so it's the same
+    on every platform and Python version."""
+    return (zlib.crc32(docid) & 0xffffffff) % nshards
+
+def shard_path(prefix, shard, nshards, suffix):
+    """PREFIX.jsent for one shard; PREFIX.007.jsent etc. for several"""
+    if nshards == 1:
+        return prefix + suffix
+    return "%s.%03d%s" % (prefix, shard, suffix)
+
+class DocLookup(object):
+    """Random access to documents across a directory of converted files
+    (e.g. gw/data/*.jdoc), via their .idx sidecars.  Indexes are loaded
+    lazily, one file at a time."""
+    def __init__(self, datadir, suffix='.jdoc'):
+        self.datadir = datadir
+        self.suffix = suffix
+        self.indexes = {}
+        self.cached_block = (None, None, None)
+
+    def path_for(self, docid):
+        return os.path.join(self.datadir, docid_to_basename(docid) + self.suffix)
+
+    def index_for(self, path):
+        if path not in self.indexes:
+            self.indexes[path] = load_index(index_path(path))
+        return self.indexes[path]
+
+    def read_record(self, f, offset, length):
+        if not f.name.endswith('.gz'):
+            f.seek(offset)
+            return f.read(length)
+        # block-gzip: lookups come in offset order, so keep the last block
+        coffset, uoffset = bgzf.split_voffset(offset)
+        if self.cached_block[:2] != (f.name, coffset):
+            self.cached_block = (f.name, coffset, bgzf.read_block(f, coffset))
+        return self.cached_block[2][uoffset:uoffset+length]
+
+    def get(self, docid):
+        """The record (line, without newline) for docid, or None."""
+        for d,rec in self.get_many([docid]):
+            return rec
+
+    def get_many(self, docids):
+        """Yields (docid, record) for the docids that are found.  Groups
+        lookups by file and reads each file in offset order, so output
+        order is not the input order."""
+        by_path = defaultdict(list)
+        for docid in docids:
+            try:
+                by_path[self.path_for(docid)].append(docid)
+            except ValueError:
+                print>>sys.stderr, "bad docid: %r" % docid
+        for path in sorted(by_path):
+            if not os.path.exists(index_path(path)):
+                print>>sys.stderr, "no index for %s" % path
+                continue
+            index = self.index_for(path)
+            found = [(index[d],d) for d in by_path[path] if d in index]
+            found.sort()
+            f = open(path, 'rb')
+            for (offset,length),docid in found:
+                yield docid, self.read_record(f, offset, length).rstrip('\n')
+            f.close()
+
+def read_sentences(prefix, nshards, keys, suffix='.jsent'):
+    """Yields (docid, sentnum, record) for the (docid, sentnum) keys found in
+    sharded jsent output, reading each shard in offset order."""
+    by_shard = defaultdict(list)
+    for key in keys:
+        by_shard[shard_of(key[0], nshards)].append(key)
+    for shard in sorted(by_shard):
+        path = shard_path(prefix, shard, nshards, suffix)
+        index = load_sentence_index(index_path(path))
+        found = sorted((index[k],k) for k in by_shard[shard] if k in index)
+        f = open(path, 'rb')
+        reader = DocLookup(None)
+        for (offset,length),(docid,sentnum) in found:
+            yield docid, sentnum, reader.read_record(f, offset, length).rstrip('\n')
+        f.close()
+
+##########################################
+
+def run_build(datafiles):
+    "Write the .idx for existing one-line-per-doc files"
+    for datafile in datafiles:
+        build_index(datafile)
+
+def run_lookup(datadir, suffix='.jdoc'):
+    "Docids on stdin; print their records"
+    lookup = DocLookup(datadir, suffix)
+    docids = [line.strip() for line in sys.stdin if line.strip()]
+    for docid,rec in lookup.get_many(docids):
+        print rec
+
+def run_sentences(prefix, nshards=1, suffix='.jsent'):
+    "'docid \\t sentnum' on stdin; print their jsent records"
+    keys = []
+    for line in sys.stdin:
+        if not line.strip(): continue
+        docid, sentnum = line.rstrip('\n').split('\t')
+        keys.append((docid, int(sentnum)))
+    for docid,sentnum,rec in read_sentences(prefix, nshards, keys, suffix):
+        print rec
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Docid indexes (see docindex.py)")
+    sub = p.add_subparsers()
+    c = sub.add_parser('build', help=run_build.__doc__)
+    c.add_argument('datafiles', nargs='+')
+    c.set_defaults(func=run_build)
+    c = sub.add_parser('lookup', help=run_lookup.__doc__)
+    c.add_argument('datadir')
+    c.add_argument('suffix', nargs='?', default='.jdoc')
+    c.set_defaults(func=run_lookup)
+    c = sub.add_parser('sentences', help=run_sentences.__doc__)
+    c.add_argument('prefix')
+    c.add_argument('nshards', nargs='?', type=int, default=1)
+    c.add_argument('suffix', nargs='?', default='.jsent')
+    c.set_defaults(func=run_sentences)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
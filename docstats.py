@@ -0,0 +1,168 @@
+"""
+Corpus statistics gathered during conversion: document type counts,
+sentence/token/entity totals, headline and dateline presence, and XML parse
+errors.  Replaces grepping every .docid file and 'sort | uniq -c'.
+
+The converters (annogw2json.py --doc-stats, and always convertall.py) write
+one small JSON summary per input file, PREFIX.docstats:
+    {"version":1, "sources":[PREFIX], "types":{"story":12158,...}, "counts":{...}}
+Summaries add up, so corpus-wide reports are a merge of the per-file ones.
+Entities are only counted for documents converted with coref, i.e. when
+jdoc or jfields is emitted ('coref_docs' says how many).
+
+Commandline:
+  python docstats.py report gw/data/*.docstats       # corpus totals
+  python docstats.py merge gw/data/*.docstats > all.docstats
+  python docstats.py doc_counts gw/data/*.docstats   # like doc_counts.txt
+  python docstats.py type_counts story gw/data/apw*.docstats   # stories per month
+"""
+import sys,os,re,json
+from collections import defaultdict
+
+VERSION = 1
+COUNTS = ['docs','parse_errors','sentences','tokens','entities','coref_docs','headlines','datelines']
+
+def doctype(docheader):
+    # what grep -Po 'type=".*?"' found
+    m = re.search(r'type="(.*?)"', docheader)
+    return m.group(1) if m else None
+
+## Per-document records.  A record is one line of text, so it can be rendered
+## and cached alongside the output formats:
+##   type \t sentences \t tokens \t entities \t headline \t dateline
+## with entities empty when coref wasn't converted.  A document that didn't
+## parse has only its type.
+
+def doc_record(docheader, meta=None, sentences=None, entities=None):
+    t = doctype(docheader) or ''
+    if meta is None:
+        return t
+    return "%s\t%d\t%d\t%s\t%d\t%d" % (t, len(sentences),
+            sum(len(s['tokens']) for s in sentences),
+            '' if entities is None else len(entities),
+            'headline' in meta, 'dateline' in meta)
+
+class DocStats(object):
+    def __init__(self, source=None, path=None):
+        # path: where save() writes, e.g. PREFIX.docstats
+        self.path = path
+        self.sources = [source] if source else []
+        self.types = defaultdict(int)
+        self.counts = defaultdict(int)
+
+    def add_record(self, record):
+        c = self.counts
+        c['docs'] += 1
+        parts = record.split('\t')
+        if parts[0]:
+            self.types[parts[0]] += 1
+        if len(parts) == 1:
+            c['parse_errors'] += 1
+            return
+        c['sentences'] += int(parts[1])
+        c['tokens'] += int(parts[2])
+        if parts[3]:
+            c['entities'] += int(parts[3])
+            c['coref_docs'] += 1
+        c['headlines'] += int(parts[4])
+        c['datelines'] += int(parts[5])
+
+    def merge(self, other):
+        """Add in another DocStats, or its to_json() dict"""
+        if isinstance(other, DocStats):
+            other = other.to_json()
+        self.sources.extend(other['sources'])
+        for k,v in other['types'].items():
+            self.types[k] += v
+        for k,v in other['counts'].items():
+            self.counts[k] += v
+
+    def to_json(self):
+        return {'version': VERSION, 'sources': self.sources,
+                'types': dict(self.types), 'counts': dict(self.counts)}
+
+    @staticmethod
+    def from_json(d, path=None):
+        if d.get('version') != VERSION:
+            raise ValueError("docstats version %r, expected %r" % (d.get('version'), VERSION))
+        s = DocStats(path=path)
+        s.merge(d)
+        return s
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_json(), f, sort_keys=True)
+            f.write('\n')
+        os.rename(tmp, path)
+
+def load(path):
+    return DocStats.from_json(json.load(open(path)), path)
+
+def merge_files(paths):
+    total = DocStats()
+    for path in paths:
+        total.merge(load(path))
+    return total
+
+def docid_file(s, path):
+    # the PREFIX.docid file that 'grep type= *.docid' used to report
+    prefix = s.sources[0] if s.sources else path
+    if prefix.endswith('.docstats'):
+        prefix = prefix[:-len('.docstats')]
+    return prefix + '.docid'
+
+##########################################
+
+def run_merge(paths):
+    "Merge .docstats files into one (on stdout)"
+    print json.dumps(merge_files(paths).to_json(), sort_keys=True)
+
+def run_report(paths):
+    "Corpus-wide totals from .docstats files"
+    s = merge_files(paths)
+    c = s.counts
+    print "%d files" % len(paths)
+    for k in COUNTS:
+        print "%12d  %s" % (c.get(k, 0), k)
+    if c.get('docs'):
+        print "%12.1f  sentences/doc" % (float(c.get('sentences', 0)) / c['docs'])
+    if c.get('sentences'):
+        print "%12.1f  tokens/sentence" % (float(c.get('tokens', 0)) / c['sentences'])
+    print "document types:"
+    for t,n in sorted(s.types.items(), key=lambda x: -x[1]):
+        print "%12d  %s" % (n, t)
+
+def run_doc_counts(paths):
+    "Per-file document type counts, in doc_counts.txt's 'uniq -c' layout"
+    rows = []
+    for path in paths:
+        s = load(path)
+        for t,n in s.types.items():
+            rows.append((docid_file(s, path), t, n))
+    for source,t,n in sorted(rows):
+        print '%7d %s:type="%s"' % (n, source, t)
+
+def run_type_counts(doctype, paths):
+    "Per-file counts of one document type (e.g. stories per month)"
+    for path in sorted(paths):
+        s = load(path)
+        print '%7d %s:type="%s"' % (s.types.get(doctype, 0), docid_file(s, path), doctype)
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Reports from .docstats files")
+    sub = p.add_subparsers()
+    for name,func in [('merge', run_merge), ('report', run_report), ('doc_counts', run_doc_counts)]:
+        c = sub.add_parser(name, help=func.__doc__)
+        c.add_argument('paths', nargs='+', metavar='DOCSTATS')
+        c.set_defaults(func=func)
+    c = sub.add_parser('type_counts', help=run_type_counts.__doc__)
+    c.add_argument('doctype')
+    c.add_argument('paths', nargs='+', metavar='DOCSTATS')
+    c.set_defaults(func=run_type_counts)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+'jcol': a columnar binary version of jdoc.
+
+Each document's tokens, lemmas, pos, ner, char_offsets and deps are stored
+as packed integer arrays, coded against string dictionaries that are built
+up per file.  New dictionary entries are written just before the first
+document that uses them, so the format streams: a reader sees them in order.
+
+File layout: MAGIC, then a sequence of records
+    type (1 byte)  length (uint32)  payload
+Record types
+    'V'  vocabulary additions: vocab number (1 byte), then a string list
+    'D'  one document (see ColumnarWriter.write)
+All integers are little-endian.  An integer array is stored as
+    typecode (1 byte)  count (uint32)  items
+using the narrowest of B/H/I that fits.
+
+Reading a document gives back the same structures that json.loads() of the
+jdoc fields would (unicode strings, lists instead of tuples).
+
+Commandline:
+  python jcolumnar.py from_jdoc < x.jdoc > x.jcol
+  python jcolumnar.py to_jdoc   < x.jcol > x.jdoc
+"""
+import sys,struct
+import jsonio
+import labelcodes
+from array import array
+
+MAGIC = 'JCOL1\n'
+
+WORDS, POS, NER, DEPLABELS = range(4)
+NUM_VOCABS = 4
+
+HAS_DEPS, HAS_PARSE = 1, 2
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+_ITEMSIZE = {'B':1, 'H':2, 'I':4}
+for _tc,_n in _ITEMSIZE.items():
+    assert array(_tc).itemsize == _n
+
+def to_utf8(s):
+    if isinstance(s, unicode):
+        return s.encode('utf8')
+    return s
+
+## Low-level packing
+
+def pack_ints(values):
+    m = max(values) if values else 0
+    tc = 'B' if m < 256 else 'H' if m < 65536 else 'I'
+    a = array(tc, values)
+    if _BIG_ENDIAN: a.byteswap()
+    return tc + struct.pack('<I', len(a)) + a.tostring()
+
+def unpack_ints(buf, pos):
+    tc = buf[pos]
+    n, = struct.unpack_from('<I', buf, pos+1)
+    pos += 5
+    end = pos + n*_ITEMSIZE[tc]
+    a = array(tc)
+    a.fromstring(buf[pos:end])
+    if _BIG_ENDIAN: a.byteswap()
+    return a, end
+
+def pack_strs(strs):
+    """strs are utf8 bytestrings"""
+    return pack_ints([len(s) for s in strs]) + ''.join(strs)
+
+def unpack_strs(buf, pos):
+    lens, pos = unpack_ints(buf, pos)
+    strs = []
+    for n in lens:
+        strs.append(buf[pos:pos+n].decode('utf8'))
+        pos += n
+    return strs, pos
+
+def pack_str(s):
+    return struct.pack('<I', len(s)) + s
+
+def unpack_str(buf, pos):
+    n, = struct.unpack_from('<I', buf, pos)
+    pos += 4
+    return buf[pos:pos+n], pos+n
+
+## Writer
+
+class ColumnarWriter(object):
+    def __init__(self, out):
+        self.out = out
+        # id 0 is reserved for None (e.g. a token with no <word>)
+        self.vocabs = [{None:0} for i in range(NUM_VOCABS)]
+        self.out.write(MAGIC)
+
+    def _write_record(self, rtype, payload):
+        self.out.write(rtype + struct.pack('<I', len(payload)) + payload)
+
+    def _code(self, vocab_num, strs, new):
+        vocab = self.vocabs[vocab_num]
+        ids = []
+        for s in strs:
+            s = to_utf8(s)
+            i = vocab.get(s)
+            if i is None:
+                i = vocab[s] = len(vocab)
+                new[vocab_num].append(s)
+            ids.append(i)
+        return ids
+
+    def write(self, docid, meta, sentences, entities):
+        """meta can be any JSON-able object (or None); sentences and entities
+        are as from core2json's converters."""
+        new = [[] for i in range(NUM_VOCABS)]
+        lens, flags = [], []
+        tok_ids, lemma_ids, pos_ids, ner_ids, offsets = [],[],[],[],[]
+        ndeps, dep_labels, govs, dependents = [],[],[],[]
+        parses = []
+        for sent in sentences:
+            lens.append(len(sent['tokens']))
+            tok_ids += self._code(WORDS, sent['tokens'], new)
+            lemma_ids += self._code(WORDS, sent['lemmas'], new)
+            pos_ids += self._code(POS, sent['pos'], new)
+            ner_ids += self._code(NER, sent['ner'], new)
+            for s,e in sent['char_offsets']:
+                offsets.append(s); offsets.append(e)
+            flag = 0
+            deps = sent.get('deps')
+            if deps is not None:
+                flag |= HAS_DEPS
+                ndeps.append(len(deps))
+                dep_labels += self._code(DEPLABELS, [d[0] for d in deps], new)
+                # governor is -1 for the root
+                govs += [d[1]+1 for d in deps]
+                dependents += [d[2]+1 for d in deps]
+            else:
+                ndeps.append(0)
+            if 'parse' in sent:
+                flag |= HAS_PARSE
+                parses.append(to_utf8(sent['parse']))
+            flags.append(flag)
+
+        for vocab_num in range(NUM_VOCABS):
+            if new[vocab_num]:
+                self._write_record('V', chr(vocab_num) + pack_strs(new[vocab_num]))
+        payload = ''.join([
+            pack_str(to_utf8(docid)),
+            pack_str(to_utf8(jsonio.dumps(meta))),
+            pack_str(to_utf8(jsonio.dumps(entities))),
+            pack_ints(lens), pack_ints(flags),
+            pack_ints(tok_ids), pack_ints(lemma_ids),
+            pack_ints(pos_ids), pack_ints(ner_ids),
+            pack_ints(offsets),
+            pack_ints(ndeps), pack_ints(dep_labels),
+            pack_ints(govs), pack_ints(dependents),
+            pack_strs(parses),
+        ])
+        self._write_record('D', payload)
+
+## Reader
+
+def decode_document(buf, vocabs):
+    """Returns (docid, meta, {'sentences':..., 'entities':...})"""
+    pos = 0
+    docid, pos = unpack_str(buf, pos)
+    meta, pos = unpack_str(buf, pos)
+    entities, pos = unpack_str(buf, pos)
+    arrays = []
+    for i in range(11):
+        a, pos = unpack_ints(buf, pos)
+        arrays.append(a)
+    lens, flags, tok_ids, lemma_ids, pos_ids, ner_ids, offsets, ndeps, dep_labels, govs, dependents = arrays
+    parses, pos = unpack_strs(buf, pos)
+    words, posv, nerv, depv = vocabs
+
+    sentences = []
+    t = d = p = 0
+    for si in range(len(lens)):
+        n = lens[si]
+        sent = {
+            'tokens': [words[i] for i in tok_ids[t:t+n]],
+            'lemmas': [words[i] for i in lemma_ids[t:t+n]],
+            'pos': [posv[i] for i in pos_ids[t:t+n]],
+            'ner': [nerv[i] for i in ner_ids[t:t+n]],
+            'char_offsets': [[offsets[2*j], offsets[2*j+1]] for j in range(t, t+n)],
+        }
+        t += n
+        if flags[si] & HAS_DEPS:
+            k = ndeps[si]
+            sent['deps'] = [[depv[dep_labels[j]], govs[j]-1, dependents[j]-1] for j in range(d, d+k)]
+            d += k
+        if flags[si] & HAS_PARSE:
+            sent['parse'] = parses[p]
+            p += 1
+        sentences.append(sent)
+    return docid, jsonio.loads(meta), {'sentences':sentences, 'entities':jsonio.loads(entities)}
+
+def yield_records(f):
+    while True:
+        header = f.read(5)
+        if not header: return
+        rtype = header[0]
+        n, = struct.unpack('<I', header[1:])
+        yield rtype, f.read(n)
+
+def read_jcol(f):
+    """Yields (docid, meta, full_info) for each document in the file."""
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("not a jcol file")
+    vocabs = [[None] for i in range(NUM_VOCABS)]
+    for rtype, buf in yield_records(f):
+        if rtype == 'V':
+            strs, _ = unpack_strs(buf, 1)
+            vocabs[ord(buf[0])].extend(strs)
+        elif rtype == 'D':
+            yield decode_document(buf, vocabs)
+        else:
+            raise ValueError("bad record type %r" % rtype)
+
+##########################################
+
+def run_from_jdoc():
+    "jdoc lines on stdin -> jcol on stdout"
+    w = ColumnarWriter(sys.stdout)
+    vocabs = None
+    for line in sys.stdin:
+        if line.startswith('#'):
+            # jcol has its own label vocabs, so coded labels are decoded
+            vocabs = labelcodes.parse_header(line) or vocabs
+            continue
+        docid, meta, full = line.rstrip('\n').split('\t')
+        full = jsonio.loads(full)
+        if vocabs is not None:
+            labelcodes.decode_info(full, vocabs)
+        w.write(docid, jsonio.loads(meta), full['sentences'], full['entities'])
+
+def run_to_jdoc():
+    "jcol on stdin -> jdoc lines on stdout"
+    for docid, meta, full in read_jcol(sys.stdin):
+        print "%s\t%s\t%s" % (to_utf8(docid), to_utf8(jsonio.dumps(meta)), to_utf8(jsonio.dumps(full)))
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="jcol conversion (stdin to stdout)")
+    sub = p.add_subparsers()
+    for name,func in [('from_jdoc', run_from_jdoc), ('to_jdoc', run_to_jdoc)]:
+        sub.add_parser(name, help=func.__doc__).set_defaults(func=func)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
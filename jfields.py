@@ -0,0 +1,148 @@
+"""
+'jfields': jdoc with each field stored as its own column, and a lazy reader
+for it (and for plain jdoc) that only decodes the fields that are used.
+
+One line per document:
+    DocID \\t Meta \\t tokens \\t lemmas \\t pos \\t ner \\t char_offsets \\t deps \\t parse \\t entities
+Each column after DocID is JSON.  The sentence fields are lists with one item
+per sentence (e.g. tokens is a list of token lists), null for a sentence
+that lacks the field (deps and parse are optional in jdoc).  JSON encoders
+escape tabs, so a line splits into its columns without any decoding.
+
+Reading:
+    for doc in jfields.read_docs(open('x.jfields')):
+        doc.docid, doc.tokens        # only the tokens column is decoded
+doc.sentences and doc.entities give exactly what jdoc's DeepInfo has.
+read_docs() also takes plain jdoc (decoded whole, on first access of any
+body field; though tokens come from core2json's small ShallowInfo column
+when it has one) and '#labelcodes' files (see labelcodes.py), so consumers
+can be written once against LazyDoc.
+
+Commandline:
+  python jfields.py from_jdoc < x.jdoc > x.jfields
+  python jfields.py to_jdoc < x.jfields > x.jdoc
+  python jfields.py tokens < x.jfields     # space-separated sentences
+"""
+import sys
+import jsonio
+import labelcodes
+
+SENTENCE_FIELDS = ['tokens','lemmas','pos','ner','char_offsets','deps','parse']
+COLUMNS = ['meta'] + SENTENCE_FIELDS + ['entities']
+
+def render_fields(docid, metastr, payload, dumps=None):
+    """A jfields line (without newline) from jdoc's DeepInfo payload"""
+    dumps = dumps or jsonio.dumps
+    sentences = payload['sentences']
+    cols = [docid, metastr]
+    for f in SENTENCE_FIELDS:
+        cols.append(dumps([s.get(f) for s in sentences]))
+    cols.append(dumps(payload['entities']))
+    return '\t'.join(cols)
+
+class LazyDoc(object):
+    """One document from a jfields or jdoc line.  Each field is decoded the
+    first time it's accessed."""
+    __slots__ = ('docid', 'cols', 'cache', 'vocabs')
+
+    def __init__(self, line, vocabs=None):
+        parts = line.rstrip('\n').split('\t')
+        self.docid = parts[0]
+        self.cols = parts[1:]
+        self.cache = {}
+        # from a '#labelcodes' header, if the labels are coded
+        self.vocabs = vocabs
+
+    @property
+    def is_jdoc(self):
+        return len(self.cols) == 2
+
+    def field(self, name):
+        if name not in self.cache:
+            if self.is_jdoc and name != 'meta':
+                self._decode_jdoc(name)
+            else:
+                self.cache[name] = self._decode(name, jsonio.loads(self.cols[COLUMNS.index(name)]))
+        return self.cache[name]
+
+    def _decode_jdoc(self, name):
+        if name == 'tokens':
+            # core2json's ShallowInfo is just the tokens
+            shallow = self.field('meta')
+            if isinstance(shallow, dict) and 'sentences' in shallow:
+                self.cache['tokens'] = [s['tokens'] for s in shallow['sentences']]
+                return
+        full = jsonio.loads(self.cols[1])
+        sentences = full['sentences']
+        for f in SENTENCE_FIELDS:
+            self.cache[f] = self._decode(f, [s.get(f) for s in sentences])
+        self.cache['entities'] = full['entities']
+
+    def _decode(self, name, value):
+        if self.vocabs is None or name not in ('pos','ner','deps'):
+            return value
+        decode = labelcodes.decode_deps if name == 'deps' else labelcodes.decode_list
+        return [None if x is None else decode(x, self.vocabs[name]) for x in value]
+
+    meta = property(lambda self: self.field('meta'))
+    tokens = property(lambda self: self.field('tokens'))
+    lemmas = property(lambda self: self.field('lemmas'))
+    pos = property(lambda self: self.field('pos'))
+    ner = property(lambda self: self.field('ner'))
+    char_offsets = property(lambda self: self.field('char_offsets'))
+    deps = property(lambda self: self.field('deps'))
+    parse = property(lambda self: self.field('parse'))
+    entities = property(lambda self: self.field('entities'))
+
+    @property
+    def sentences(self):
+        """Sentence dicts, as in jdoc (a field a sentence lacks is left out)"""
+        cols = [(f, self.field(f)) for f in SENTENCE_FIELDS]
+        sents = []
+        for i in range(len(cols[0][1])):
+            sent = {}
+            for f,values in cols:
+                if values[i] is not None:
+                    sent[f] = values[i]
+            sents.append(sent)
+        return sents
+
+def read_docs(f):
+    """Yields a LazyDoc per document line of a jfields or jdoc file"""
+    vocabs = None
+    for line in f:
+        if line.startswith('#'):
+            vocabs = labelcodes.parse_header(line) or vocabs
+            continue
+        yield LazyDoc(line, vocabs)
+
+##########################################
+
+def run_from_jdoc():
+    "jdoc on stdin -> jfields on stdout"
+    for doc in read_docs(sys.stdin):
+        payload = {'sentences': doc.sentences, 'entities': doc.entities}
+        print render_fields(doc.docid, doc.cols[0], payload)
+
+def run_to_jdoc():
+    "jfields on stdin -> jdoc on stdout"
+    for doc in read_docs(sys.stdin):
+        print "%s\t%s\t%s" % (doc.docid, doc.cols[0],
+            jsonio.dumps({'sentences': doc.sentences, 'entities': doc.entities}))
+
+def run_tokens():
+    "Print each sentence's tokens, space-separated, decoding nothing else"
+    for doc in read_docs(sys.stdin):
+        for toks in doc.tokens:
+            print u' '.join(toks).encode('utf8')
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="jfields conversion (stdin to stdout)")
+    sub = p.add_subparsers()
+    for name,func in [('from_jdoc', run_from_jdoc), ('to_jdoc', run_to_jdoc), ('tokens', run_tokens)]:
+        sub.add_parser(name, help=func.__doc__).set_defaults(func=func)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
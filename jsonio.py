@@ -0,0 +1,206 @@
+"""
+The JSON encoder/decoder all the converters and readers use, with a choice
+of backends.
+
+Every backend's dumps() returns compact utf8-encoded bytes (a str), so
+callers can put them straight into output lines with no decode/encode.
+The backends' outputs all decode to the same values, but aren't byte-for-
+byte the same:
+    ujson       non-ASCII as raw utf8; escapes '/' as '\\/'
+    orjson      non-ASCII as raw utf8 (python 3 only)
+    rapidjson   non-ASCII as raw utf8
+    simplejson  non-ASCII as raw utf8
+    json        the standard library, non-ASCII as \\uXXXX escapes (its
+                fast C path)
+    json-utf8   the standard library, non-ASCII as raw utf8 (slower)
+
+By default ujson is used if it's installed, else json, which is what the
+converters always did; the others are only used when asked for, since
+they change the output bytes.  Set AGW_JSON_BACKEND=name in the
+environment, call set_backend(), or pass --json-backend to the converters
+to choose one.  An AGW_JSON_BACKEND that can't be used doesn't stop the
+import: the default is used and the problem is left in env_error, which
+the converters report.  Use the module functions as jsonio.dumps(x) /
+jsonio.loads(s), not imported by name, so a later set_backend() is seen.
+
+Commandline:
+  # which backends are installed
+  python jsonio.py backends
+  # time each backend on sample documents (jdoc, or AGW XML), and check
+  # their outputs are equivalent
+  python jsonio.py bench gw/data/nyt_eng_199407.jdoc 2000
+"""
+import sys,os,time,itertools
+import json
+
+def _stdlib_ascii():
+    return (lambda x: json.dumps(x, separators=(',',':'))), json.loads
+
+def _stdlib_utf8():
+    def dumps(x):
+        s = json.dumps(x, separators=(',',':'), ensure_ascii=False)
+        return s.encode('utf8') if isinstance(s, unicode) else s
+    return dumps, json.loads
+
+def _ujson():
+    import ujson
+    return (lambda x: ujson.dumps(x, ensure_ascii=False)), ujson.loads
+
+def _orjson():
+    import orjson
+    return orjson.dumps, orjson.loads
+
+def _rapidjson():
+    import rapidjson
+    def dumps(x):
+        s = rapidjson.dumps(x, ensure_ascii=False)
+        return s.encode('utf8') if isinstance(s, unicode) else s
+    return dumps, rapidjson.loads
+
+def _simplejson():
+    import simplejson
+    def dumps(x):
+        s = simplejson.dumps(x, separators=(',',':'), ensure_ascii=False)
+        return s.encode('utf8') if isinstance(s, unicode) else s
+    return dumps, simplejson.loads
+
+# name -> function returning (dumps, loads); raises ImportError if the
+# library isn't installed
+BACKENDS = {
+    'ujson': _ujson,
+    'orjson': _orjson,
+    'rapidjson': _rapidjson,
+    'simplejson': _simplejson,
+    'json': _stdlib_ascii,
+    'json-utf8': _stdlib_utf8,
+}
+# the default is the first installed of these; the rest are opt-in
+DEFAULTS = ['ujson', 'json']
+# listing order
+PREFERENCE = ['ujson', 'orjson', 'rapidjson', 'simplejson', 'json']
+
+# buffer size for the output files dumps() bytes are written to: lines go
+# out in large writes instead of the default 4-8K ones
+OUTPUT_BUFSIZE = 1 << 20
+
+def load_backend(name):
+    """(dumps, loads) for a backend; ValueError if unknown, ImportError if
+    not installed"""
+    if name not in BACKENDS:
+        raise ValueError("unknown JSON backend %r, expected one of: %s" % (name, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[name]()
+
+def available_backends():
+    names = []
+    for name in PREFERENCE + sorted(set(BACKENDS) - set(PREFERENCE)):
+        try:
+            load_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def default_backend():
+    for name in DEFAULTS:
+        try:
+            load_backend(name)
+        except ImportError:
+            continue
+        return name
+
+backend = None
+dumps = loads = None
+
+def set_backend(name):
+    global backend, dumps, loads
+    dumps, loads = load_backend(name)
+    backend = name
+
+# set if AGW_JSON_BACKEND names a backend that's unknown or not installed
+env_error = None
+try:
+    set_backend(os.environ.get('AGW_JSON_BACKEND') or default_backend())
+except (ValueError, ImportError) as e:
+    env_error = "AGW_JSON_BACKEND=%s: %s" % (os.environ['AGW_JSON_BACKEND'], e)
+    set_backend(default_backend())
+
+## Benchmark
+
+def sample_documents(filename, limit):
+    """Up to 'limit' documents as the objects the converters serialize:
+    from jdoc (meta and DeepInfo), or converted from AGW XML"""
+    import annogw2json
+    f = annogw2json.smartopen(filename)
+    first = f.readline()
+    lines = itertools.chain([first], f)
+    objs = []
+    if first.startswith('<'):
+        for docheader, docstr in ((annogw2json.docheader_from_docstr(d), d) for d in annogw2json.yield_annogw_docstr(lines)):
+            doc_x = annogw2json.parse_docstr(docstr)
+            if doc_x is None: continue
+            docid, meta, payload = annogw2json.convert_doc_element(doc_x, 'full')
+            objs += [meta, payload]
+            if len(objs) >= 2*limit: break
+    else:
+        for line in lines:
+            if line.startswith('#'): continue
+            parts = line.rstrip('\n').split('\t')
+            objs += [json.loads(p) for p in parts[1:]]
+            if len(objs) >= 2*limit: break
+    return objs
+
+def bench_backend(name, objs, reps=3):
+    """(best dumps secs, best loads secs, output bytes, equivalent?)"""
+    d, l = load_backend(name)
+    best_d = best_l = None
+    for r in range(reps):
+        t0 = time.time()
+        out = [d(x) for x in objs]
+        t1 = time.time()
+        back = [l(s) for s in out]
+        t2 = time.time()
+        best_d = t1-t0 if best_d is None else min(best_d, t1-t0)
+        best_l = t2-t1 if best_l is None else min(best_l, t2-t1)
+    # equivalent: the stdlib decoder reads back what it reads from its own
+    # encoding (tuples come back as lists either way)
+    same = all(isinstance(s, str) and json.loads(s) == json.loads(json.dumps(x))
+               for s,x in zip(out, objs))
+    return best_d, best_l, sum(len(s) for s in out), same
+
+##########################################
+
+def run_backends():
+    "List installed backends, and which is the default and in use"
+    if env_error:
+        print >>sys.stderr, env_error
+    default = default_backend()
+    for name in available_backends():
+        notes = [s for s,yes in [('default', name == default), ('in use', name == backend)] if yes]
+        print name + (' (%s)' % ', '.join(notes) if notes else '')
+
+def run_bench(filename, limit=1000):
+    "Time each installed backend on sample documents (jdoc or AGW XML)"
+    objs = sample_documents(filename, limit)
+    print "%d objects (meta + body for %d documents)" % (len(objs), len(objs)//2)
+    print "%-12s %10s %10s %10s  %s" % ('backend', 'dumps', 'loads', 'MB out', 'equivalent')
+    results = []
+    for name in available_backends():
+        d, l, nbytes, same = bench_backend(name, objs)
+        results.append((d, name))
+        print "%-12s %9.3fs %9.3fs %10.2f  %s" % (name, d, l, nbytes/1e6, 'yes' if same else 'NO')
+    best = min(results)[1]
+    print "fastest dumps: %s  (use AGW_JSON_BACKEND=%s or --json-backend %s)" % (best, best, best)
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="JSON backends")
+    sub = p.add_subparsers()
+    sub.add_parser('backends', help=run_backends.__doc__).set_defaults(func=run_backends)
+    c = sub.add_parser('bench', help=run_bench.__doc__)
+    c.add_argument('filename')
+    c.add_argument('limit', nargs='?', type=int, default=1000, help="documents (default %(default)s)")
+    c.set_defaults(func=run_bench)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Integer codes for the closed-vocabulary labels in jdoc/jsent output: POS
+tags, NER types and dependency labels.
+
+A coded file starts with a header line giving the vocabularies,
+    #labelcodes \t {"version":1, "pos":[...], "ner":[...], "deps":[...]}
+and in each sentence, 'pos' and 'ner' are lists of ints indexing into them,
+and each dep is [label int, governor, dependent].  A label that isn't in
+the header's vocab (e.g. an unusual collapsed prep_ label) stays a string,
+so the header never has to change after it's written.  The vocabs are
+ordered roughly by frequency in AGW, so common labels get 1-digit codes.
+
+Commandline:
+  # coded jdoc or jsent on stdin -> the plain version on stdout
+  python labelcodes.py decode < x.jdoc > x.plain.jdoc
+The decoded file has the same values as a plain (uncoded) conversion, but
+isn't byte-identical to one: keys within a sentence can come out in a
+different order.
+"""
+import sys,json
+import jsonio
+
+HEADER_TAG = '#labelcodes'
+VERSION = 1
+
+POS_TAGS = ['NN', 'IN', 'NNP', 'DT', 'JJ', 'NNS', ',', '.', 'CD', 'RB', 'VBD', 'VB',
+    'CC', 'TO', 'VBZ', 'VBN', 'PRP', 'VBG', 'VBP', 'MD', 'POS', 'PRP$', '$', '``',
+    "''", ':', 'WDT', 'JJR', 'NNPS', 'RP', 'WP', 'WRB', 'JJS', 'RBR', '-RRB-',
+    '-LRB-', 'EX', 'RBS', 'PDT', 'FW', 'WP$', '#', 'UH', 'SYM', 'LS']
+NER_TAGS = ['O', 'PERSON', 'ORGANIZATION', 'LOCATION', 'DATE', 'NUMBER', 'MISC',
+    'MONEY', 'PERCENT', 'TIME', 'ORDINAL', 'DURATION', 'SET']
+DEP_LABELS = ['det', 'nn', 'nsubj', 'amod', 'dobj', 'root', 'prep_in', 'poss', 'aux',
+    'num', 'prep_of', 'advmod', 'conj_and', 'dep', 'cc', 'cop', 'neg', 'ccomp',
+    'xcomp', 'mark', 'nsubjpass', 'auxpass', 'prep_to', 'prep_for', 'prep_on',
+    'prep_with', 'prep_at', 'prep_by', 'prep_from', 'appos', 'tmod', 'rcmod',
+    'partmod', 'infmod', 'quantmod', 'npadvmod', 'number', 'possessive', 'prt',
+    'predet', 'iobj', 'expl', 'parataxis', 'csubj', 'csubjpass', 'complm', 'rel',
+    'purpcl', 'acomp', 'attr', 'mwe', 'preconj', 'punct', 'pcomp', 'pobj', 'abbrev',
+    'conj_or', 'conj_but', 'prep_as', 'prep_into', 'prep_about', 'prep_after',
+    'prep_than', 'prep_over', 'prep_since', 'prep_under', 'prep_through',
+    'prep_during', 'prep_before', 'prep_against', 'prep_between', 'prep_like',
+    'prep_without', 'prep_because_of', 'prep_including', 'prep_until', 'prep_among']
+
+DEFAULT_VOCABS = {'pos': POS_TAGS, 'ner': NER_TAGS, 'deps': DEP_LABELS}
+
+class LabelCoder(object):
+    def __init__(self, vocabs=DEFAULT_VOCABS):
+        self.vocabs = vocabs
+        self.pos = dict((s,i) for i,s in enumerate(vocabs['pos']))
+        self.ner = dict((s,i) for i,s in enumerate(vocabs['ner']))
+        self.deps = dict((s,i) for i,s in enumerate(vocabs['deps']))
+
+    def header_line(self):
+        h = {'version': VERSION}
+        h.update(self.vocabs)
+        return "%s\t%s\n" % (HEADER_TAG, json.dumps(h, separators=(',',':')))
+
+    def encode_sentence(self, sent):
+        """A copy of a sentence dict with its labels coded"""
+        sent = dict(sent)
+        if 'pos' in sent:
+            get = self.pos.get
+            sent['pos'] = [get(s, s) for s in sent['pos']]
+        if 'ner' in sent:
+            get = self.ner.get
+            sent['ner'] = [get(s, s) for s in sent['ner']]
+        if sent.get('deps') is not None:
+            get = self.deps.get
+            sent['deps'] = [[get(d[0], d[0]), d[1], d[2]] for d in sent['deps']]
+        return sent
+
+    def encode_sentences(self, sentences):
+        return [self.encode_sentence(s) for s in sentences]
+
+## Reading
+
+def parse_header(line):
+    """The vocabs from a header line, or None if it isn't one"""
+    if not line.startswith(HEADER_TAG + '\t'):
+        return None
+    h = json.loads(line.split('\t', 1)[1])
+    if h.get('version') != VERSION:
+        raise ValueError("labelcodes header version %r, expected %r" % (h.get('version'), VERSION))
+    return h
+
+def decode_list(xs, vocab):
+    return [vocab[x] if isinstance(x, int) else x for x in xs]
+
+def decode_deps(deps, vocab):
+    return [[vocab[d[0]] if isinstance(d[0], int) else d[0], d[1], d[2]] for d in deps]
+
+def decode_sentence(sent, vocabs):
+    """Undoes LabelCoder.encode_sentence(), in place"""
+    if 'pos' in sent:
+        sent['pos'] = decode_list(sent['pos'], vocabs['pos'])
+    if 'ner' in sent:
+        sent['ner'] = decode_list(sent['ner'], vocabs['ner'])
+    if sent.get('deps') is not None:
+        sent['deps'] = decode_deps(sent['deps'], vocabs['deps'])
+    return sent
+
+def decode_info(info, vocabs):
+    """Decodes, in place, a jdoc DeepInfo ({'sentences':..., ...}) or a
+    jsent sentence record"""
+    if isinstance(info, dict) and 'sentences' in info:
+        for s in info['sentences']: decode_sentence(s, vocabs)
+    elif isinstance(info, dict) and 'tokens' in info:
+        decode_sentence(info, vocabs)
+    return info
+
+##########################################
+
+def run_decode():
+    "Coded jdoc or jsent on stdin -> plain on stdout"
+    vocabs = None
+    for line in sys.stdin:
+        if vocabs is None:
+            vocabs = parse_header(line)
+            if vocabs is not None: continue
+            # not coded: pass everything through
+            sys.stdout.write(line)
+            for line in sys.stdin: sys.stdout.write(line)
+            return
+        parts = line.rstrip('\n').split('\t')
+        parts[-1] = jsonio.dumps(decode_info(jsonio.loads(parts[-1]), vocabs))
+        print '\t'.join(parts)
+
+def main():
+    import argparse; p = argparse.ArgumentParser(description="Integer-coded labels")
+    sub = p.add_subparsers()
+    sub.add_parser('decode', help=run_decode.__doc__).set_defaults(func=run_decode)
+    args = vars(p.parse_args())
+    args.pop('func')(**args)
+
+if __name__=='__main__':
+    main()
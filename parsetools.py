@@ -13,8 +13,16 @@ N   V  V
     VP-------- 
 S------------- 
 """
-import sys
+import sys,re
 from collections import namedtuple
+from itertools import islice
+
+_SEXPR_TOKEN_RE = re.compile(r'[()]|[^() \t\r\n]+')
+# the old char-by-char parser silently dropped an atom directly followed by
+# '(', like 'b' in '(A b(C d))', and an atom running up to the end of the
+# string.  we keep that behavior; such strings are rare, so check cheaply first.
+_SEXPR_ATOM_BEFORE_PAREN_RE = re.compile(r'[^() \t\r\n]\(')
+_SEXPR_DROPPED_ATOM_RE = re.compile(r'[^() \t\r\n]+(?=\()|[^() \t\r\n]+\Z')
 
 def parse_sexpr(s, add_root=True):
   """Parse an s-expression into a nested list-of-lists-and-strings."""
@@ -22,40 +30,64 @@ def parse_sexpr(s, add_root=True):
   if first_paren == -1:
     raise BadSexpr("no paren")
   s = s[first_paren:]
+  if s[-1] not in '() \t\r\n' or _SEXPR_ATOM_BEFORE_PAREN_RE.search(s):
+    s = _SEXPR_DROPPED_ATOM_RE.sub('', s)
   tree = []
-  stack = []  # top of stack (index -1) points to current node in tree
-  stack.append(tree)
-  curtok = ""
-  depth = 0
-  for c in s:
-    if c=='(':
+  stack = [tree]  # top of stack (index -1) points to current node in tree
+  cur = tree
+  for tok in _SEXPR_TOKEN_RE.findall(s):
+    if tok == '(':
       new = []
-      stack[-1].append(new)
+      cur.append(new)
       stack.append(new)
-      curtok = ""
-      depth += 1
-    elif c==')':
-      if curtok:
-        stack[-1].append(curtok)
-        curtok = ""
+      cur = new
+    elif tok == ')':
       stack.pop()
-      curtok = ""
-      depth -= 1
-    #elif c.isspace():
-    elif c in (' ','\t','\r','\n'):  ## dont want funny unicode ones?
-      if curtok:
-        stack[-1].append(curtok)
-        curtok = ""
+      if not stack: raise BadSexpr("Too many closing parens")
+      cur = stack[-1]
     else:
-      curtok += c
-    if depth<0: raise BadSexpr("Too many closing parens")
-  if depth>0: raise BadSexpr("Didn't close all parens, depth %d" % depth)
+      cur.append(tok)
+  if len(stack) > 1: raise BadSexpr("Didn't close all parens, depth %d" % (len(stack)-1))
   root = tree[0]
   # weird, treebank parses have an extra, unlabeled node on top
   if isinstance(root[0], list) and add_root:
     root = ["ROOT"] + root
   return root
 
+CompactTree = namedtuple('CompactTree', 'labels parents spans')
+
+def compact_tree(tree):
+  """Flat-array form of a parse: nodes in preorder, where
+    labels[i]   the node's label, or the word for a terminal
+    parents[i]  index of the parent node, -1 for the root
+    spans[i]    (start,end) terminal indexes covered by the node
+  Children are tree[1:], as in terminals()."""
+  labels, parents, spans = [], [], []
+  ntok = 0
+  # entries are (node, parent index), or (None, i) to close node i's span
+  todo = [(tree, -1)]
+  while todo:
+    node, parent = todo.pop()
+    if node is None:
+      spans[parent] = (spans[parent][0], ntok)
+      continue
+    i = len(labels)
+    parents.append(parent)
+    if node_is_leaf(node):
+      labels.append(node)
+      spans.append((ntok, ntok+1))
+      ntok += 1
+      continue
+    labels.append(node[0] if node and node_is_leaf(node[0]) else None)
+    spans.append((ntok, ntok))
+    todo.append((None, i))
+    for child in reversed(node[1:]):
+      todo.append((child, i))
+  return CompactTree(labels, parents, spans)
+
+def parse_sexpr_compact(s, add_root=True):
+  return compact_tree(parse_sexpr(s, add_root))
+
 class BadSexpr(Exception): pass
 
 def is_balanced(s):
@@ -95,26 +127,50 @@ def iter_parses(line_iter=sys.stdin, raw=False, parsed=False, both=False):
   if cur:
     yield result(cur)
 
+## The tree walkers are iterative (explicit stacks of child iterators), so
+## they are linear time and don't hit the recursion limit on deep trees.
+
+def iter_terminals(tree):
+  "Generator version of terminals()."
+  if node_is_leaf(tree):
+    yield tree
+    return
+  stack = [islice(tree, 1, None)]
+  while stack:
+    for child in stack[-1]:
+      if node_is_leaf(child):
+        yield child
+      else:
+        stack.append(islice(child, 1, None))
+        break
+    else:
+      stack.pop()
+
 def terminals(tree):
   "The terminals (leaves) of the tree, in order."
-  if node_is_leaf(tree):
-    return [tree]
-  leaves = []
-  for child in tree[1:]:
-    leaves += terminals(child)
-  return leaves
+  return list(iter_terminals(tree))
+
+def is_preterminal_ish(node):
+  # was len(tree)==2 but (CD 412 682 6878) violates .. encoding issue??
+  return len(node)>=2 and node_is_leaf(node[1])
+
+def iter_preterminals(tree):
+  "Generator version of preterminals()."
+  stack = [iter([tree])]
+  while stack:
+    for node in stack[-1]:
+      if node_is_leaf(node):
+        assert False, "shouldnt be here"
+      if is_preterminal_ish(node):
+        yield node
+      else:
+        stack.append(islice(node, 1, None))
+        break
+    else:
+      stack.pop()
 
 def preterminals(tree):
-  if node_is_leaf(tree):
-    assert False, "shouldnt be here"
-    return []
-  # was len(tree)==2 but (CD 412 682 6878) violates .. encoding issue??
-  if len(tree)>=2 and node_is_leaf(tree[1]):
-    return [tree]
-  ret = []
-  for child in tree[1:]:
-    ret += preterminals(child)
-  return ret
+  return list(iter_preterminals(tree))
 
 def fix_preterminals(tree):
   preterms = preterminals(tree)
@@ -125,11 +181,32 @@ def fix_preterminals(tree):
 def bfs_walk(tree):
   """Yields pointers to tree positions, so node_is_preterminal and node_is_leaf work.
   Need to take node[0] in most cases."""
-  yield tree
-  if node_is_leaf(tree): return
-  for child in tree[1:]:
-    for x in bfs_walk(child):
-      yield x
+  stack = [iter([tree])]
+  while stack:
+    for node in stack[-1]:
+      yield node
+      if not node_is_leaf(node):
+        stack.append(islice(node, 1, None))
+        break
+    else:
+      stack.pop()
+
+def iter_terminal_paths(tree, above_path=None):
+  "Generator version of terminal_paths()."
+  path = list(above_path or [])
+  stack = [iter([tree])]
+  while stack:
+    for node in stack[-1]:
+      if node_is_leaf(node):
+        yield path + [node]
+      else:
+        path.append(node)
+        stack.append(islice(node, 1, None))
+        break
+    else:
+      # every stack entry past the first holds the children of path[-1]
+      stack.pop()
+      if stack: path.pop()
 
 def terminal_paths(tree, above_path=None):
   """
@@ -142,14 +219,40 @@ def terminal_paths(tree, above_path=None):
   madness: the first element is actually the entire tree, and each element
   shows progressively smaller subtrees at that point.
   """
-  above_path = above_path or []
-  my_path = above_path + [tree]
-  if node_is_leaf(tree):
-    return [my_path]
-  paths_for_terminals_below = []
-  for child in tree[1:]:
-    paths_for_terminals_below += terminal_paths(child, my_path)
-  return paths_for_terminals_below
+  return list(iter_terminal_paths(tree, above_path))
+
+def terminals_and_preterminal_spans(trees):
+  """Batch version for a whole document's parses, with one walk per tree.
+  Returns a list with one (terminals, spans) pair per tree, where spans has
+  a (label, start, end) terminal range for each of preterminals(tree)."""
+  results = []
+  for tree in trees:
+    toks, spans = [], []
+    if node_is_leaf(tree):
+      results.append(([tree], spans))
+      continue
+    # stack entries: (child iterator, index into spans to close, or None)
+    stack = [(iter([tree]), None)]
+    in_preterminal = False
+    while stack:
+      for node in stack[-1][0]:
+        if node_is_leaf(node):
+          toks.append(node)
+          continue
+        span_i = None
+        if not in_preterminal and is_preterminal_ish(node):
+          span_i = len(spans)
+          spans.append([node[0], len(toks), None])
+          in_preterminal = True
+        stack.append((islice(node, 1, None), span_i))
+        break
+      else:
+        it, span_i = stack.pop()
+        if span_i is not None:
+          spans[span_i][2] = len(toks)
+          in_preterminal = False
+    results.append((toks, [tuple(sp) for sp in spans]))
+  return results
 
 def which_is_identical(seq, x):
   """Like list.index(), but tests for object identity ("is"),
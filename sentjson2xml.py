@@ -2,40 +2,146 @@
 input: 'sentjson' format (from annogw2json.py)
 output format is tokens-only, and XML
 preserve headlines vs body distinction .. why not
+
+  cat x.justsent | python sentjson2xml.py > x.sentxml
+  python sentjson2xml.py x.justsent.gz --workers 4 > x.sentxml
+
+Input can be plain, gzip, or block-gzip (bgzf.py) .justsent.  Documents are
+converted in chunks, each rendered to one string and written with one
+write().  With --workers, chunks are converted in a process pool (in
+input order); for block-gzip input each worker also decompresses its own
+blocks.
 """
 
-import sys,re
-import ujson as json
-from xml.sax.saxutils import escape
+import sys,re,itertools
+import jsonio
+
+HEADER = '<documents>'
+FOOTER = '</documents>'
 
 def emit_str(xmlstr):
     print xmlstr
 
-print '<documents>'
-for line in sys.stdin:
-    docid,headjson,bodyjson = line.rstrip('\n').split('\t')
-    head_dat = json.loads(headjson)
-    body_dat = json.loads(bodyjson)
-    datestr = re.search(r'_(\d\d\d\d\d\d\d\d)\.', docid).group(1)
-    ymd = "{}-{}-{}".format(datestr[:4], datestr[4:6], datestr[6:8])
-    print '<document id="{}" pubdate="{}" type="{}">'.format(
-            docid, ymd, head_dat['type'])
-    for k in ['headline','dateline']:
-        if k in head_dat:
-            print '<%s>' % k
-            head_spacetok = u' '.join(head_dat[k]['tokens'])
-            print escape(head_spacetok.encode('utf8'))
-            print '</%s>' % k
+_date_re = re.compile(r'_(\d\d\d\d\d\d\d\d)\.')
 
-    print '<sentences>'
+def pubdate(docid):
+    """'NYT_ENG_19940701.0001' -> '1994-07-01'"""
+    # fast path for the usual layout, where the date follows the last '_'
+    i = docid.rfind('_') + 1
+    datestr = docid[i:i+8]
+    if docid[i+8:i+9] != '.' or not datestr.isdigit():
+        datestr = _date_re.search(docid).group(1)
+    return "%s-%s-%s" % (datestr[:4], datestr[4:6], datestr[6:8])
 
+def document_lines(lines, docid, head_dat, body_dat):
+    """Appends a <document> element's lines to 'lines'.  head_dat is the
+    MetaInfo dict, body_dat the list of sentences (dicts with 'tokens')."""
+    append = lines.append
+    # (str.format keeps this a byte string when the JSON decoder gives unicode)
+    append('<document id="{}" pubdate="{}" type="{}">'.format(docid, pubdate(docid), head_dat['type']))
+    for k in ['headline','dateline']:
+        # headlines whose parse failed have only 'text', no 'tokens'
+        if k in head_dat and 'tokens' in head_dat[k]:
+            append('<%s>' % k)
+            append(xml_escape(u' '.join(head_dat[k]['tokens']).encode('utf8')))
+            append('</%s>' % k)
+    append('<sentences>')
     for i,sent in enumerate(body_dat):
-        spacetok = u' '.join(sent['tokens'])
-        print '<sentence id="body:{}">'.format(i)
-        print escape(spacetok.encode('utf8'))
-        print '</sentence>'
+        append('<sentence id="body:%d">' % i)
+        # xml_escape(), inlined
+        append(u' '.join(sent['tokens']).encode('utf8').replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;'))
+        append('</sentence>')
+    append('</sentences>')
+    append('</document>')
+
+def xml_escape(s):
+    # same as xml.sax.saxutils.escape()
+    return s.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+
+def document_xml(docid, head_dat, body_dat):
+    """One <document> element, as a string"""
+    lines = []
+    document_lines(lines, docid, head_dat, body_dat)
+    return '\n'.join(lines)
+
+def convert_lines(jlines):
+    """.justsent lines -> their <document>s as one string"""
+    lines = []
+    loads = jsonio.loads
+    for line in jlines:
+        if not line or line == '\n': continue
+        docid,headjson,bodyjson = line.rstrip('\n').split('\t')
+        document_lines(lines, docid, loads(headjson), loads(bodyjson))
+    lines.append('')
+    return '\n'.join(lines)
+
+def convert_member(member):
+    """One raw block-gzip member -> its <document>s as one string"""
+    import bgzf
+    return convert_lines(bgzf.decompress_member(member).split('\n'))
+
+def chunks(lines, size):
+    while True:
+        chunk = list(itertools.islice(lines, size))
+        if not chunk: return
+        yield chunk
+
+def open_input(filename):
+    """Returns (kind, source): ('bgzf', file) or ('lines', line iterator)"""
+    if filename is None or filename == '-':
+        return 'lines', sys.stdin
+    if filename.endswith('.gz'):
+        import bgzf
+        f = open(filename, 'rb')
+        if bgzf.is_block_gzip(f):
+            return 'bgzf', f
+        import gzip
+        f.close()
+        return 'lines', gzip.open(filename)
+    return 'lines', open(filename)
+
+def convert_stream(kind, source, out, workers=1, chunksize=200, window=None):
+    """Writes the whole XML file for the input to out.  With workers, at
+    most 'window' chunks (default 4 per worker) are in flight at once."""
+    if kind == 'bgzf':
+        import bgzf
+        work, items = convert_member, (m for c,m in bgzf.iter_members(source))
+    else:
+        work, items = convert_lines, chunks(iter(source), chunksize)
+    out.write(HEADER + '\n')
+    if workers > 1:
+        import multiprocessing
+        from collections import deque
+        window = window or 4*workers
+        pool = multiprocessing.Pool(workers)
+        pending = deque()
+        try:
+            for item in items:
+                if len(pending) >= window:
+                    out.write(pending.popleft().get())
+                pending.append(pool.apply_async(work, (item,)))
+            while pending:
+                out.write(pending.popleft().get())
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for item in items:
+            out.write(work(item))
+    out.write(FOOTER + '\n')
 
-    print '</sentences>'
+def main():
+    import argparse; p = argparse.ArgumentParser()
+    p.add_argument('input', nargs='?', help=".justsent file, plain or .gz (default: stdin)")
+    p.add_argument('--workers', type=int, default=1, help="number of conversion processes")
+    p.add_argument('--chunksize', type=int, default=200,
+            help="documents per work unit (for non-block-gzip input)")
+    args = p.parse_args()
+    kind, source = open_input(args.input)
+    convert_stream(kind, source, sys.stdout, args.workers, args.chunksize)
 
-    print '</document>'
-print '</documents>'
+if __name__=='__main__':
+    main()